@@ -0,0 +1,1076 @@
+"""
+Offline harness for the stock scraper
+Serves fixture pages from a local HTTP server so the scraper can be checked
+and benchmarked without hitting Trendlyne or Zerodha
+
+Usage:
+python offline_harness.py check-details
+python offline_harness.py check-resilience --stocks 200 --fail-rate 0.3
+python offline_harness.py check-incremental --stocks 100
+python offline_harness.py check-jobs
+python offline_harness.py bench-details --stocks 100 --latency 0.05
+python offline_harness.py bench-details --fixtures path/to/saved/pages
+python offline_harness.py bench-bot --chats 200 --messages 5 [--flood]
+python offline_harness.py bench-extract --scrips 3000 [--fixtures DIR]    (needs Chrome)
+python offline_harness.py bench-pipeline --repeat 3 [--warm] [--fixtures DIR]
+python offline_harness.py bench-map --symbols 10000
+python offline_harness.py bench-screens --screens 4 --stocks 250 --latency 0.05
+python offline_harness.py bench-startup --repeat 5
+
+bench-extract, bench-pipeline and bench-screens start Chrome. Offline, point
+CHROMEDRIVER at a chromedriver binary; without it, a failed webdriver_manager
+download falls back to Selenium Manager or a chromedriver on PATH.
+
+Saved pages are served by their path relative to the fixtures directory,
+e.g. fixtures/equity/123/ABC/abc-ltd/index.html -> /equity/123/ABC/abc-ltd/
+For bench-pipeline the directory must also hold the margin calculator at
+margin-calculator/Equity/index.html and the gainers table at
+top-gainers/index.html, with stock links pointing at /equity/... paths.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import script
+from script import CombinedStockScraper, ScrapeMetrics, percentile
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+# ============================================================================
+# FIXTURE PAGES
+# ============================================================================
+
+MARGIN_PATH = "/margin-calculator/Equity/"
+GAINERS_PATH = "/top-gainers/"
+
+DETAIL_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>{name} share price</title></head>
+<body>
+<div class="stock-header">
+  <h1><span class="stock_info_heading">
+    {name}
+  </span></h1>
+  <span class="stock_exchange_details">
+    <span>NSE: {nse}</span> | <span>BSE: {bse}</span> | <span>{sector}</span>
+  </span>
+</div>
+<table class="fundamentals"><tbody>{filler}</tbody></table>
+</body>
+</html>
+"""
+
+# Same page, but the heading is filled in by JavaScript, so only a real
+# browser can read it - the HTTP fast path must hand these to Selenium
+CLIENT_RENDERED_DETAIL_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Loading...</title></head>
+<body>
+<h1><span class="stock_info_heading"></span></h1>
+<span class="stock_exchange_details"></span>
+<script>
+document.querySelector(".stock_info_heading").textContent = "{name}";
+document.querySelector(".stock_exchange_details").textContent = "NSE: {nse} | BSE: {bse}";
+</script>
+</body>
+</html>
+"""
+
+
+def make_stocks(count):
+    """Synthetic universe: list of dicts with name, nse, bse and Trendlyne path"""
+    stocks = []
+    for i in range(1, count + 1):
+        nse = f"SYM{i:04d}"
+        stocks.append({
+            "name": f"Synthetic Industries {i} Ltd.",
+            "nse": nse,
+            "bse": str(500000 + i),
+            "path": f"/equity/{1000 + i}/{nse}/synthetic-industries-{i}-ltd/",
+        })
+    return stocks
+
+
+def build_detail_pages(stocks, client_rendered_every=0):
+    """
+    Render a detail page per stock
+    Every Nth stock uses the client-rendered variant when client_rendered_every > 0
+    """
+    filler = "".join(f"<tr><td>Metric {i}</td><td>{i * 3.7:.2f}</td></tr>" for i in range(200))
+    pages = {}
+    for i, stock in enumerate(stocks, 1):
+        template = DETAIL_PAGE
+        if client_rendered_every and i % client_rendered_every == 0:
+            template = CLIENT_RENDERED_DETAIL_PAGE
+        pages[stock["path"]] = template.format(sector="Industrials", filler=filler, **stock)
+    return pages
+
+
+def make_multipliers(count, stocks=()):
+    """Synthetic Zerodha universe: every given stock plus filler scrips, as {scrip: raw multiplier}"""
+    multipliers = {}
+    for i, stock in enumerate(stocks):
+        multipliers[stock["nse"]] = "5" if i % 3 == 0 else "3"
+    for i in range(len(multipliers), count):
+        multipliers[f"FILL{i:05d}"] = str(1 + i % 5)
+    return multipliers
+
+
+def build_margin_page(multipliers):
+    """Zerodha margin calculator table, including the edge cases the extractor must filter"""
+    rows = []
+    for scrip, multiplier in multipliers.items():
+        rows.append(f'<tr data-scrip=" {scrip.lower()} " data-mis_multiplier="{multiplier}">'
+                    f'<td>{scrip}</td><td>{multiplier}x</td></tr>')
+    # A header-like row with an empty scrip and a row with no multiplier
+    rows.append('<tr data-scrip="" data-mis_multiplier="5"><td></td></tr>')
+    rows.append('<tr data-scrip="NOMULT"><td>NOMULT</td></tr>')
+    return ("<!DOCTYPE html><html><head><title>Margin Calculator</title></head><body>"
+            "<table><thead><tr><th>Scrip</th><th>MIS</th></tr></thead><tbody>"
+            + "".join(rows) + "</tbody></table></body></html>")
+
+
+def build_gainers_page(stocks):
+    """Trendlyne top-gainers table with an entries dropdown and a few rows without stock links"""
+    rows = []
+    for i, stock in enumerate(stocks, 1):
+        rows.append(f'<tr><td>{i}</td><td><a href="{stock["path"]}">{stock["nse"]}</a></td>'
+                    f'<td><a href="/fundamentals/{stock["nse"]}/">Fundamentals</a></td></tr>')
+        if i % 25 == 0:
+            rows.append('<tr class="ad-row"><td colspan="3">Advertisement</td></tr>')
+    return ("<!DOCTYPE html><html><head><title>Top Gainers</title></head><body>"
+            '<select name="entries"><option value="25">25</option><option value="100">100</option></select>'
+            "<table><tbody>" + "".join(rows) + "</tbody></table></body></html>")
+
+
+class MarginRowParser(HTMLParser):
+    """Browser-free reading of tr[data-scrip] rows, with the scraper's filtering rules"""
+
+    def __init__(self):
+        super().__init__()
+        self.multipliers = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "tr" and attrs.get("data-scrip", "").strip():
+            self.multipliers[attrs["data-scrip"].strip().upper()] = (attrs.get("data-mis_multiplier") or "0").strip()
+
+
+def load_saved_pages(fixtures_dir):
+    """Load recorded HTML pages from a directory, keyed by URL path"""
+    pages = {}
+    for root, _, files in os.walk(fixtures_dir):
+        for filename in files:
+            if not filename.endswith(".html"):
+                continue
+            file_path = os.path.join(root, filename)
+            rel_path = os.path.relpath(file_path, fixtures_dir).replace(os.sep, "/")
+            if filename == "index.html":
+                url_path = "/" + rel_path[:-len("index.html")]
+            else:
+                url_path = "/" + rel_path
+            with open(file_path, encoding="utf-8") as f:
+                pages[url_path] = f.read()
+    return pages
+
+# ============================================================================
+# FIXTURE SERVER
+# ============================================================================
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    """Serve server.pages[path] with an optional artificial latency and share of 503 errors"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            self.send_error(503)
+            return
+
+        path = self.path.split("?", 1)[0]
+        page = self.server.pages.get(path)
+        if page is None:
+            self.send_error(404)
+            return
+
+        body = page.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """Local HTTP server for fixture pages, usable as a context manager"""
+
+    def __init__(self, pages=None, latency=0.0, handler=FixtureRequestHandler, fail_rate=0.0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.pages = pages or {}
+        self.httpd.latency = latency
+        self.httpd.fail_rate = fail_rate
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# ============================================================================
+# FAKE TELEGRAM API
+# ============================================================================
+
+class FakeTelegramState:
+    """
+    Pending updates and recorded replies of the fake Telegram API
+    flood_limits: (per chat, global) sends allowed per second; more get a 429 with retry_after
+    """
+
+    def __init__(self, flood_limits=None):
+        self.cond = threading.Condition()
+        self.updates = []
+        self.next_update_id = 1
+        self.replies = {}
+        self.calls = {}
+        self.flood_limits = flood_limits
+        self.recent_sends = {}  # chat_id (None for all chats) -> send times in the last second
+
+    def push_message(self, chat_id, text):
+        """Queue an incoming user message; returns the number of replies the chat had before it"""
+        with self.cond:
+            self.updates.append({
+                "update_id": self.next_update_id,
+                "message": {"chat": {"id": chat_id}, "text": text, "date": int(time.time())},
+            })
+            self.next_update_id += 1
+            self.cond.notify_all()
+            return len(self.replies.get(chat_id, []))
+
+    def take_updates(self, offset, timeout):
+        """Long poll: confirm updates below offset and wait up to timeout for newer ones"""
+        deadline = time.time() + timeout
+        with self.cond:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.time() < deadline:
+                self.cond.wait(deadline - time.time())
+            return list(self.updates[:100])
+
+    def check_flood(self, chat_id):
+        """Count a send attempt; returns retry_after seconds if it breaks a flood limit, else 0"""
+        if not self.flood_limits:
+            return 0
+        now = time.time()
+        with self.cond:
+            for key, limit in zip((chat_id, None), self.flood_limits):
+                sends = self.recent_sends.setdefault(key, deque())
+                while sends and now - sends[0] >= 1:
+                    sends.popleft()
+                if len(sends) >= limit:
+                    self.calls["429"] = self.calls.get("429", 0) + 1
+                    return 1
+            for key in (chat_id, None):
+                self.recent_sends[key].append(now)
+            return 0
+
+    def record_reply(self, method, chat_id, text=None):
+        with self.cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.replies.setdefault(chat_id, []).append((time.perf_counter(), method, text))
+            self.cond.notify_all()
+
+    def count_upload(self, size):
+        """Record a document upload of size bytes; returns how many there have been"""
+        with self.cond:
+            self.calls["uploads"] = self.calls.get("uploads", 0) + 1
+            self.calls["upload_bytes"] = self.calls.get("upload_bytes", 0) + size
+            return self.calls["uploads"]
+
+    def wait_reply(self, chat_id, seen, timeout, prefix=None):
+        """
+        Wait for the chat to get a reply after the first `seen` ones; returns it or None
+        With prefix, wait for the first such reply whose text starts with it
+        """
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                for reply in self.replies.get(chat_id, [])[seen:]:
+                    if prefix is None or (reply[2] or "").startswith(prefix):
+                        return reply
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Minimal Bot API: getUpdates, sendMessage and sendDocument under /bot<token>/"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _method(self):
+        return self.path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+    def do_GET(self):
+        if self._method() != "getUpdates":
+            self._reply({"ok": False, "description": "Not Found"}, 404)
+            return
+        query = dict(part.split("=", 1) for part in self.path.partition("?")[2].split("&") if "=" in part)
+        updates = self.server.state.take_updates(int(query.get("offset", 0)), float(query.get("timeout", 0)))
+        self._reply({"ok": True, "result": updates})
+
+    def do_POST(self):
+        method = self._method()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        file_id = None
+        if method == "sendMessage":
+            payload = json.loads(body or b"{}")
+            chat_id, text = payload.get("chat_id"), payload.get("text")
+        elif method == "sendDocument" and self.headers.get("Content-Type", "").startswith("application/json"):
+            # Re-send of a stored file by file_id
+            payload = json.loads(body)
+            chat_id, text, file_id = payload.get("chat_id"), None, payload.get("document")
+        elif method == "sendDocument":
+            match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body)
+            chat_id, text = (int(match.group(1)) if match else None), None
+        else:
+            self._reply({"ok": False, "description": "Not Found"}, 404)
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        retry_after = self.server.state.check_flood(chat_id)
+        if retry_after:
+            self._reply({"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                         "parameters": {"retry_after": retry_after}}, 429)
+            return
+        self.server.state.record_reply(method, chat_id, text)
+        result = {"message_id": 1, "chat": {"id": chat_id}}
+        if method == "sendDocument":
+            result["document"] = {"file_id": file_id or f"doc-{self.server.state.count_upload(len(body))}"}
+        self._reply({"ok": True, "result": result})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTelegramServer(FixtureServer):
+    """Local stand-in for api.telegram.org, usable as a context manager"""
+
+    def __init__(self, latency=0.0, flood_limits=None):
+        super().__init__(latency=latency, handler=FakeTelegramHandler)
+        self.state = self.httpd.state = FakeTelegramState(flood_limits)
+
+    @property
+    def api_url(self):
+        return self.base_url + "/botTEST"
+
+# ============================================================================
+# DETAIL ENGINE CHECK AND BENCHMARK
+# ============================================================================
+
+def check_details(args):
+    """Verify the HTTP fast path parses every server-rendered fixture and rejects client-rendered ones"""
+    stocks = make_stocks(args.stocks)
+    pages = build_detail_pages(stocks, client_rendered_every=10)
+    scraper = CombinedStockScraper()
+    failures = 0
+
+    with FixtureServer(pages) as server:
+        for i, stock in enumerate(stocks, 1):
+            full_name, nse_code = scraper.fetch_stock_detail_http(server.url(stock["path"]))
+            if i % 10 == 0:
+                expected = ("N/A", "N/A")
+            else:
+                expected = (stock["name"], stock["nse"])
+            if (full_name, nse_code) != expected:
+                failures += 1
+                print(f"FAIL {stock['path']}: got {(full_name, nse_code)}, expected {expected}")
+
+    print(f"{len(stocks) - failures}/{len(stocks)} detail fixtures OK")
+    return failures == 0
+
+
+def bench_details(args):
+    """Time the HTTP detail engine against the fixture server"""
+    if args.fixtures:
+        pages = load_saved_pages(args.fixtures)
+        paths = [path for path in pages if "/equity/" in path]
+    else:
+        stocks = make_stocks(args.stocks)
+        pages = build_detail_pages(stocks)
+        paths = [stock["path"] for stock in stocks]
+
+    scraper = CombinedStockScraper()
+    latencies = []
+    resolved = 0
+
+    with FixtureServer(pages, latency=args.latency) as server:
+        def timed_fetch(url):
+            fetch_start = time.perf_counter()
+            full_name, nse_code = scraper.fetch_stock_detail_http(url)
+            latencies.append(time.perf_counter() - fetch_start)
+            return nse_code != "N/A"
+
+        bench_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            resolved = sum(executor.map(timed_fetch, [server.url(path) for path in paths]))
+        elapsed = time.perf_counter() - bench_start
+
+    print(f"Pages:      {len(paths)} ({resolved} resolved)")
+    print(f"Workers:    {args.workers}")
+    print(f"Wall time:  {elapsed:.3f}s ({len(paths) / elapsed:.1f} pages/s)")
+    print(f"Latency:    p50 {percentile(latencies, 50) * 1000:.1f}ms | "
+          f"p95 {percentile(latencies, 95) * 1000:.1f}ms | "
+          f"mean {statistics.mean(latencies) * 1000:.1f}ms")
+    return True
+
+def counter_total(metrics, name):
+    return sum(value for (counter, _), value in metrics.counters.items() if counter == name)
+
+
+def check_resilience(args):
+    """Resolve detail pages from a flaky host, then from a dead one, and report what retries recovered"""
+    stocks = make_stocks(args.stocks)
+    pages = build_detail_pages(stocks)
+    fail_rate = args.fail_rate or 0.3
+    ok = True
+
+    with FixtureServer(pages, latency=args.latency, fail_rate=fail_rate) as server:
+        links = [server.url(stock["path"]) for stock in stocks]
+        for label, rate in ((f"flaky host ({fail_rate:.0%} 503s)", fail_rate), ("dead host (100% 503s)", 1.0)):
+            server.httpd.fail_rate = rate
+            scraper = CombinedStockScraper(symbol_cache=False, leverage_index=False, result_store=False,
+                                           breaker_settings={"reset_timeout": 2})
+            start = time.perf_counter()
+            results = scraper.resolve_stock_details(links)
+            elapsed = time.perf_counter() - start
+
+            resolved = sum(row is not None for row in results)
+            print(f"{label}: {resolved}/{len(links)} resolved in {elapsed:.2f}s | "
+                  f"retries {counter_total(scraper.metrics, 'fetch_retries_total')} | "
+                  f"circuit rejections {counter_total(scraper.metrics, 'circuit_rejections_total')} | "
+                  f"re-queued {counter_total(scraper.metrics, 'detail_requeued_total')} | "
+                  f"dropped {counter_total(scraper.metrics, 'detail_dropped_total')}")
+            # Three attempts plus one re-queue pass leave ~0.3**6 of a flaky host's pages unresolved
+            if rate < 1:
+                ok = ok and resolved >= 0.99 * len(links)
+
+    return ok
+
+
+def check_incremental(args):
+    """Re-rank the list with a few newcomers: incremental mode must match a full run while fetching only them"""
+    count = min(args.stocks, 100)
+    newcomers = max(1, count // 20)
+    stocks = make_stocks(count + newcomers)
+    pages = build_detail_pages(stocks)
+    leverage = {stock["nse"]: "5x" if i % 3 == 0 else "3x" for i, stock in enumerate(stocks)}
+    ok = True
+
+    with FixtureServer(pages, latency=args.latency) as server, tempfile.TemporaryDirectory() as store_dir:
+        first = [server.url(stock["path"]) for stock in stocks[:count]]
+        # Next list: the same stocks reshuffled, the last few dropping out for the newcomers
+        second = first[:count - newcomers] + [server.url(stock["path"]) for stock in stocks[count:]]
+        random.Random(0).shuffle(second)
+
+        def run(scraper, links):
+            scraper.collect_trendlyne_links = lambda url: links
+            scraper._start_run()
+            trendlyne_df = scraper.scrape_trendlyne_gainers()
+            return scraper.save_results(scraper.map_leverage(trendlyne_df, leverage))
+
+        store = script.ResultStore(os.path.join(store_dir, "results.db"))
+        run(CombinedStockScraper(symbol_cache=False, leverage_index=False, result_store=store), first)
+
+        incremental = CombinedStockScraper(symbol_cache=False, leverage_index=False, result_store=store,
+                                           incremental=True)
+        start = time.perf_counter()
+        incremental_df = run(incremental, second)
+        incremental_s = time.perf_counter() - start
+
+        full = CombinedStockScraper(symbol_cache=False, leverage_index=False, result_store=False)
+        start = time.perf_counter()
+        full_df = run(full, second)
+        full_s = time.perf_counter() - start
+
+        delta = incremental.rank_deltas.get(script.DEFAULT_SCREEN, {})
+        identical = incremental_df.equals(full_df)
+        print(f"full run:        {full_s:6.2f}s | {detail_fetches(full.metrics):4} detail fetches")
+        print(f"incremental run: {incremental_s:6.2f}s | {detail_fetches(incremental.metrics):4} detail fetches")
+        print(f"rank delta: {len(delta.get('entries', []))} entries, {len(delta.get('exits', []))} exits, "
+              f"{len(delta.get('moves', []))} moves | output identical to full run: {identical}")
+        ok = identical and detail_fetches(incremental.metrics) == newcomers \
+            and len(delta.get("entries", [])) == newcomers == len(delta.get("exits", []))
+
+        # Past the TTL nothing is carried over: every row's page is fetched again
+        ttl, script.SYMBOL_CACHE_TTL = script.SYMBOL_CACHE_TTL, 0
+        try:
+            expired = CombinedStockScraper(symbol_cache=False, leverage_index=False, result_store=store,
+                                           incremental=True)
+            expired_df = run(expired, second)
+        finally:
+            script.SYMBOL_CACHE_TTL = ttl
+        print(f"expired run:             {detail_fetches(expired.metrics):4} detail fetches | "
+              f"output identical to full run: {expired_df.equals(full_df)}")
+        ok = ok and expired_df.equals(full_df) and detail_fetches(expired.metrics) == count
+
+    return ok
+
+# ============================================================================
+# ROW EXTRACTION BENCHMARK
+# ============================================================================
+
+def bench_extract(args):
+    """Compare bulk execute_script row extraction with the per-element path in a real Chrome"""
+    if args.fixtures:
+        pages = load_saved_pages(args.fixtures)
+        missing = [path for path in (MARGIN_PATH, GAINERS_PATH) if path not in pages]
+        if missing:
+            raise SystemExit(f"Fixtures directory has no page for {', '.join(missing)}")
+    else:
+        stocks = make_stocks(args.stocks)
+        pages = build_detail_pages(stocks)
+        pages[MARGIN_PATH] = build_margin_page(make_multipliers(args.scrips, stocks))
+        pages[GAINERS_PATH] = build_gainers_page(stocks)
+
+    scraper = CombinedStockScraper(symbol_cache=False, leverage_index=False)
+    cases = [
+        ("zerodha", MARGIN_PATH,
+         scraper.extract_zerodha_multipliers, scraper.extract_zerodha_multipliers_per_element),
+        ("trendlyne", GAINERS_PATH,
+         scraper.extract_trendlyne_links, scraper.extract_trendlyne_links_per_element),
+    ]
+    ok = True
+
+    with FixtureServer(pages, latency=args.latency) as server:
+        try:
+            driver = script.build_chrome_driver(headless=True)
+        except Exception as e:
+            print(f"Skipped, Chrome unavailable ({str(e).splitlines()[0]})")
+            return False
+        try:
+            for name, path, bulk, per_element in cases:
+                driver.get(server.url(path))
+                timings = {}
+                outputs = {}
+                for label, extract in (("bulk", bulk), ("per-element", per_element)):
+                    runs = []
+                    for _ in range(args.repeat):
+                        extract_start = time.perf_counter()
+                        outputs[label] = extract(driver)
+                        runs.append(time.perf_counter() - extract_start)
+                    timings[label] = statistics.median(runs)
+
+                same = outputs["bulk"] == outputs["per-element"]
+                ok = ok and same
+                rows, values = outputs["bulk"]
+                print(f"{name:<10} rows {rows:>6} | values {len(values):>6} | "
+                      f"bulk {timings['bulk'] * 1000:8.1f}ms | per-element {timings['per-element'] * 1000:9.1f}ms | "
+                      f"speedup {timings['per-element'] / timings['bulk']:6.1f}x | "
+                      f"{'same output' if same else 'OUTPUT MISMATCH'}")
+        finally:
+            driver.quit()
+
+    return ok
+
+# ============================================================================
+# LEVERAGE MAPPING BENCHMARK
+# ============================================================================
+
+def legacy_map_and_order(trendlyne_df, zerodha_5x_set):
+    """The original per-row apply + double filter + concat implementation, kept as a reference"""
+    result_df = trendlyne_df.copy()
+    result_df['Leverage'] = result_df['NSE'].apply(lambda x: '5x' if x.upper() in zerodha_5x_set else 'NA')
+    result_df = result_df[['Stock Name', 'NSE', 'Leverage']]
+    len(result_df[result_df['Leverage'] == '5x'])
+    len(result_df[result_df['Leverage'] == 'NA'])
+
+    result_df_5x = result_df[result_df['Leverage'] == '5x'].reset_index(drop=True)
+    result_df_na = result_df[result_df['Leverage'] == 'NA'].reset_index(drop=True)
+    result_df_sorted = pd.concat([result_df_5x, result_df_na], ignore_index=True)
+    return result_df_sorted[['Stock Name', 'NSE', 'Leverage']].copy()
+
+
+def bench_map(args):
+    """Time map_leverage + order_results against the legacy implementation on a whole-universe screen"""
+    stocks = make_stocks(args.symbols)
+    trendlyne_df = pd.DataFrame([{"Stock Name": stock["name"], "NSE": stock["nse"].lower() if i % 7 == 0 else stock["nse"]}
+                                 for i, stock in enumerate(stocks)])
+    # Multipliers 1x-5x across the universe, plus scrips Trendlyne does not list
+    multipliers = make_multipliers(args.symbols + args.scrips, stocks)
+    for i, stock in enumerate(stocks):
+        multipliers[stock["nse"]] = str(1 + i % 5)
+    build_start = time.perf_counter()
+    all_leverage_data = CombinedStockScraper.leverage_table(multipliers)
+    build_time = time.perf_counter() - build_start
+    zerodha_5x_set = {scrip for scrip, multiplier in multipliers.items() if multiplier == "5"}
+
+    scraper = CombinedStockScraper(symbol_cache=False, leverage_index=False)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    def timed(func):
+        runs = []
+        for _ in range(args.repeat):
+            run_start = time.perf_counter()
+            output = func()
+            runs.append(time.perf_counter() - run_start)
+        return statistics.median(runs), output
+
+    legacy_time, legacy_df = timed(lambda: legacy_map_and_order(trendlyne_df, zerodha_5x_set))
+    print(f"Symbols: {len(trendlyne_df)} | leverage table: {len(all_leverage_data)} scrips")
+    print(f"  legacy (apply + concat)     {legacy_time * 1000:8.1f}ms")
+    print(f"  leverage table build        {build_time * 1000:8.1f}ms (once per Zerodha scrape, not per mapping)")
+
+    ok = True
+    for min_leverage in (5, 3):
+        vector_time, vector_df = timed(lambda: scraper.order_results(
+            scraper.map_leverage(trendlyne_df, all_leverage_data, min_leverage=min_leverage)))
+        note = ""
+        if min_leverage == 5:
+            same = vector_df.equals(legacy_df)
+            ok = ok and same
+            note = " | same output as legacy" if same else " | OUTPUT MISMATCH"
+        leveraged = int(vector_df['Leverage'].ne('NA').sum())
+        print(f"  vectorized >={min_leverage}x            {vector_time * 1000:8.1f}ms "
+              f"({legacy_time / vector_time:5.1f}x) | {leveraged} leveraged{note}")
+    return ok
+
+# ============================================================================
+# FULL PIPELINE BENCHMARK
+# ============================================================================
+
+def build_pipeline_pages(args):
+    """Margin calculator, gainers table and detail pages: recorded ones from --fixtures, else synthetic"""
+    if args.fixtures:
+        pages = load_saved_pages(args.fixtures)
+        missing = [path for path in (MARGIN_PATH, GAINERS_PATH) if path not in pages]
+        if missing:
+            raise SystemExit(f"Fixtures directory has no page for {', '.join(missing)}")
+        return pages
+
+    stocks = make_stocks(args.stocks)
+    pages = build_detail_pages(stocks)
+    pages[MARGIN_PATH] = build_margin_page(make_multipliers(args.scrips, stocks))
+    pages[GAINERS_PATH] = build_gainers_page(stocks)
+    return pages
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its reaped children (Chrome), in MB"""
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def print_stage_table(metrics):
+    for stage, summary in sorted(metrics.report()["stages"].items()):
+        print(f"  {stage:<22} n={summary['count']:<5} p50 {summary['p50_s'] * 1000:9.1f}ms | "
+              f"p95 {summary['p95_s'] * 1000:9.1f}ms | max {summary['max_s'] * 1000:9.1f}ms")
+
+
+def bench_pipeline(args):
+    """Replay recorded or synthetic pages and time CombinedStockScraper per stage and end to end"""
+    pages = build_pipeline_pages(args)
+    equity_paths = [path for path in pages if "/equity/" in path]
+    ok = True
+
+    with FixtureServer(pages, latency=args.latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+        def new_scraper(run):
+            # Cold runs get empty caches; --warm shares them so later runs measure steady state
+            suffix = "" if args.warm else f"_{run}"
+            return CombinedStockScraper(
+                concurrent=args.concurrent,
+                detail_engine=args.engine,
+                symbol_cache=script.SymbolCache(os.path.join(cache_dir, f"symbols{suffix}.db")),
+                leverage_index=script.LeverageIndex(os.path.join(cache_dir, f"leverage{suffix}.db")),
+                trendlyne_url=server.url(GAINERS_PATH),
+                zerodha_url=server.url(MARGIN_PATH),
+            )
+
+        # Per stage, without a browser
+        print(f"Per-stage ({len(equity_paths)} detail pages, no browser):")
+        scraper = new_scraper("stages")
+        margin_parser = MarginRowParser()
+        margin_parser.feed(pages[MARGIN_PATH])
+        all_leverage_data = scraper.leverage_table(margin_parser.multipliers)
+
+        jobs = list(enumerate([server.url(path) for path in equity_paths], 1))
+        results = [None] * len(jobs)
+        with scraper.metrics.time("details_all"):
+            unresolved = scraper._fetch_details_http(jobs, results)
+        trendlyne_df = pd.DataFrame([row for row in results if row])
+        with scraper.metrics.time("map_and_order"):
+            ordered = scraper.order_results(scraper.map_leverage(trendlyne_df, all_leverage_data))
+        store = script.ResultStore(os.path.join(cache_dir, "results.db"))
+        with scraper.metrics.time("save_snapshot"):
+            store.save(ordered, scraper.timestamp)
+        with scraper.metrics.time("export_xlsx_csv"):
+            scraper.export_results(ordered, os.path.join(cache_dir, "export.xlsx"), os.path.join(cache_dir, "export.csv"))
+        print_stage_table(scraper.metrics)
+        print(f"  unresolved over HTTP: {len(unresolved)}")
+
+        # End to end, which needs Chrome for the list pages
+        try:
+            script.DRIVER_POOL.warm(1)
+        except Exception as e:
+            print(f"\nEnd-to-end: skipped, Chrome unavailable ({str(e).splitlines()[0]})")
+        else:
+            combined = ScrapeMetrics()
+            wall_times = []
+            print(f"\nEnd-to-end ({args.repeat} runs, engine={args.engine}, "
+                  f"{'concurrent' if args.concurrent else 'sequential'}, {'warm' if args.warm else 'cold'} caches):")
+            for run in range(1, args.repeat + 1):
+                scraper = new_scraper(run)
+                run_start = time.perf_counter()
+                result_df = scraper.scrape(save_files=False)
+                wall_times.append(time.perf_counter() - run_start)
+                combined.merge(scraper.metrics)
+
+                rows = 0 if result_df is None else len(result_df)
+                ok = ok and rows > 0
+                print(f"  run {run}: {wall_times[-1]:7.2f}s | {rows} rows | {rows / wall_times[-1]:6.1f} stocks/s")
+
+            print_stage_table(combined)
+            print(f"  wall time: p50 {percentile(wall_times, 50):.2f}s | p95 {percentile(wall_times, 95):.2f}s")
+
+    own_rss, child_rss = peak_rss_mb()
+    if own_rss is not None:
+        print(f"Peak RSS: {own_rss:.0f} MB (harness) | {child_rss:.0f} MB (largest exited child)")
+    return ok
+
+def detail_fetches(metrics):
+    """Detail pages actually requested (cache hits excluded)"""
+    return sum(value for (name, _), value in metrics.counters.items() if name == "detail_pages_total")
+
+
+def bench_screens(args):
+    """Overlapping screens: one job per screen versus one deduplicated multi-screen run"""
+    stocks = make_stocks(args.stocks)
+    step = max(1, (len(stocks) - 100) // max(1, args.screens - 1)) if len(stocks) > 100 else 0
+    screen_stocks = {f"screen-{i}": stocks[i * step:i * step + 100] for i in range(args.screens)}
+
+    pages = build_detail_pages(stocks)
+    pages[MARGIN_PATH] = build_margin_page(make_multipliers(args.scrips, stocks))
+    for name, members in screen_stocks.items():
+        pages[f"{GAINERS_PATH}{name}/"] = build_gainers_page(members)
+
+    ok = True
+    with FixtureServer(pages, latency=args.latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+        screens = {name: server.url(f"{GAINERS_PATH}{name}/") for name in screen_stocks}
+        links_by_screen = {name: [server.url(stock["path"]) for stock in members]
+                           for name, members in screen_stocks.items()}
+        listed = sum(len(links) for links in links_by_screen.values())
+
+        def new_scraper(tag):
+            return CombinedStockScraper(
+                detail_engine=args.engine,
+                symbol_cache=script.SymbolCache(os.path.join(cache_dir, f"symbols_{tag}.db")),
+                leverage_index=script.LeverageIndex(os.path.join(cache_dir, f"leverage_{tag}.db")),
+                zerodha_url=server.url(MARGIN_PATH),
+            )
+
+        # Detail stage only, cold caches, without a browser
+        print(f"{args.screens} screens, {listed} listed stocks, "
+              f"{len({link for links in links_by_screen.values() for link in links})} unique:")
+        separate = ScrapeMetrics()
+        start = time.perf_counter()
+        for name, links in links_by_screen.items():
+            job = new_scraper(name)
+            job.scrape_stock_details(links)
+            separate.merge(job.metrics)
+        separate_s = time.perf_counter() - start
+
+        shared = new_scraper("shared")
+        unique_links = list(dict.fromkeys(link for links in links_by_screen.values() for link in links))
+        start = time.perf_counter()
+        details = dict(zip(unique_links, shared.resolve_stock_details(unique_links)))
+        shared_s = time.perf_counter() - start
+
+        ok = all(details[link] for link in unique_links)
+        print(f"  one job per screen: {separate_s:7.2f}s | {detail_fetches(separate):5} detail fetches")
+        print(f"  deduplicated:       {shared_s:7.2f}s | {detail_fetches(shared.metrics):5} detail fetches")
+
+        # End to end, which needs Chrome for the list pages
+        try:
+            script.DRIVER_POOL.warm(1)
+        except Exception as e:
+            print(f"\nEnd-to-end: skipped, Chrome unavailable ({str(e).splitlines()[0]})")
+        else:
+            scraper = new_scraper("e2e")
+            start = time.perf_counter()
+            results = scraper.scrape_screens(screens, save_files=False)
+            elapsed = time.perf_counter() - start
+            ok = ok and bool(results) and len(results) == len(screens)
+            print(f"\nEnd-to-end scrape_screens: {elapsed:.2f}s | {detail_fetches(scraper.metrics)} detail fetches")
+            for name, result_df in (results or {}).items():
+                print(f"  {name:<12} {len(result_df)} rows")
+            print_stage_table(scraper.metrics)
+
+    return ok
+
+# ============================================================================
+# BOT RUNTIME BENCHMARK
+# ============================================================================
+
+BOT_COMMANDS = ["/start", "/top10", "25", "/top50", "/all", "7", "hello"]
+TABLE_COMMANDS = {"/top10", "25", "/top50", "/all", "7"}
+
+
+def bench_bot(args):
+    """Drive the bot's async runtime from many simulated chats against the fake Telegram API"""
+    scrape_count = [0]
+
+    # Stand in for the scraper so only the bot runtime is measured
+    # Rows are resolved one by one over --scrape-seconds, with the same progress events as a real run
+    def fake_scrape(self, save_files=True):
+        scrape_count[0] += 1
+        self.set_output_paths()
+        stocks = make_stocks(100)
+        leverage = {stock["nse"]: "5x" if i % 3 == 0 else "3x" for i, stock in enumerate(stocks)}
+        self._notify("leverage", leverage)
+        self._notify("links", len(stocks))
+
+        rows = []
+        for rank, stock in enumerate(stocks, 1):
+            time.sleep(args.scrape_seconds / len(stocks))
+            rows.append({"Stock Name": stock["name"], "NSE": stock["nse"]})
+            self._notify("row", rank, rows[-1])
+        result_df = self.map_leverage(pd.DataFrame(rows), leverage)
+        return self.save_results(result_df) if save_files else self.order_results(result_df)
+
+    script.CombinedStockScraper.scrape = fake_scrape
+    logging.getLogger().setLevel(logging.WARNING)
+    import scrapper_bot as bot
+
+    # Snapshots go to a throwaway store, so the bot uploads its CSV and then re-sends it by file_id
+    store_dir = tempfile.mkdtemp()
+    bot._scraper = CombinedStockScraper(concurrent=True,
+                                        result_store=script.ResultStore(os.path.join(store_dir, "results.db")))
+    bot.WARM_DRIVERS = 0   # the stand-in scrape never starts Chrome
+    if args.stale:
+        bot.SNAPSHOTS.max_age = 0
+    # --schedule runs the background refresher against an always-open market, scaled to the fake scrape
+    bot.REFRESH_SCHEDULE = args.schedule
+    if args.schedule:
+        bot.market_seconds = lambda start, end: max(0.0, (end - start).total_seconds())
+        bot.market_deadline = lambda start, seconds: start + timedelta(seconds=max(0.0, seconds))
+        bot.SNAPSHOTS.max_age = args.scrape_seconds * 4
+        bot.SCRAPE_DURATION_ESTIMATE = args.scrape_seconds
+        bot.SCHEDULE_JITTER = args.scrape_seconds / 10
+        bot.SCHEDULE_MIN_GAP = 0.1
+    latencies, table_latencies = [], []
+
+    # --flood makes the fake API enforce Telegram-like limits (3 per chat and 30 overall per second)
+    with FakeTelegramServer(latency=args.latency, flood_limits=(3, 30) if args.flood else None) as server:
+        bot.TELEGRAM_API_URL = server.api_url
+        bot.POLL_TIMEOUT = 1
+        threading.Thread(target=asyncio.run, args=(bot.main_async(),), daemon=True).start()
+
+        def simulate_chat(chat_id):
+            for i in range(args.messages):
+                command = BOT_COMMANDS[(chat_id + i) % len(BOT_COMMANDS)]
+                sent_at = time.perf_counter()
+                seen = server.state.push_message(chat_id, command)
+                reply = server.state.wait_reply(chat_id, seen, timeout=60)
+                if reply is None:
+                    print(f"chat {chat_id}: no reply within 60s")
+                    return
+                latencies.append(reply[0] - sent_at)
+
+                # Commands that answer with a table: time until the table itself arrives
+                if command in TABLE_COMMANDS:
+                    table = server.state.wait_reply(chat_id, seen, timeout=60, prefix="Top Gainers")
+                    if table is not None:
+                        table_latencies.append(table[0] - sent_at)
+
+        bench_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.chats) as executor:
+            list(executor.map(simulate_chat, range(1, args.chats + 1)))
+        elapsed = time.perf_counter() - bench_start
+
+    total = args.chats * args.messages
+    print(f"Chats:      {args.chats} x {args.messages} messages ({len(latencies)}/{total} answered)")
+    print(f"Wall time:  {elapsed:.3f}s ({len(latencies) / elapsed:.1f} msgs/s)")
+    print(f"First reply latency: p50 {percentile(latencies, 50) * 1000:.1f}ms | "
+          f"p95 {percentile(latencies, 95) * 1000:.1f}ms | max {max(latencies or [0]) * 1000:.1f}ms")
+    print(f"Table latency:       p50 {percentile(table_latencies, 50) * 1000:.1f}ms | "
+          f"p95 {percentile(table_latencies, 95) * 1000:.1f}ms | max {max(table_latencies or [0]) * 1000:.1f}ms")
+    print(f"API calls:  {server.state.calls}")
+    print(f"Scrapes:    {scrape_count[0]}")
+    queries = {dict(labels).get("snapshot"): value for (name, labels), value in script.METRICS.counters.items()
+               if name == "bot_queries_total"}
+    print(f"Queries:    {queries.get('fresh', 0)} served fresh, {queries.get('stale', 0)} waited on a scrape")
+    jobs = {dict(labels).get("result"): value for (name, labels), value in script.METRICS.counters.items()
+            if name == "bot_scrape_requests_total"}
+    print(f"Scrape requests: {jobs.get('started', 0)} started, {jobs.get('coalesced', 0)} joined a queued or running job")
+    shutil.rmtree(store_dir, ignore_errors=True)
+    return len(latencies) == total
+
+def check_jobs(args):
+    """Queue scrapes on one slot: same-key requests share a job, other keys wait, a hung job is abandoned"""
+    import scrapper_bot as bot
+    runs = []
+
+    def work(key):
+        def scrape():
+            started = time.perf_counter()
+            time.sleep(0.2)
+            runs.append((key, started, time.perf_counter()))
+            return key
+        return scrape
+
+    async def drive():
+        jobs = bot.ScrapeJobs(max_running=1)
+        first = jobs.submit("gainers", work("gainers"))
+        joined = jobs.submit("gainers", work("gainers"))
+        other = jobs.submit("losers", work("losers"))
+        await asyncio.sleep(0.1)
+        depth = jobs.depth()
+        results = await asyncio.gather(first, joined, other)
+        return first is joined, first is not other, depth, results
+
+    # A hung job: past the timeout it resolves to None, is aborted, and a fresh job can take the slot
+    async def drive_hung():
+        jobs = bot.ScrapeJobs(max_running=1, timeout=0.2)
+        released = threading.Event()
+        hung = await jobs.submit("gainers", released.wait, abort=released.set)
+        retried = await asyncio.wait_for(jobs.submit("gainers", lambda: "fresh"), 1)
+        return hung, released.is_set(), retried
+
+    shared, separate, depth, results = asyncio.run(drive())
+    in_order = [key for key, _, _ in runs] == ["gainers", "losers"] and runs[1][1] >= runs[0][2]
+    print(f"same key shared one job: {shared} | other key got its own: {separate} | queued behind it: {depth}")
+    print(f"scrapes run: {len(runs)} {[key for key, _, _ in runs]} | one after the other: {in_order} | "
+          f"results: {results}")
+    hung, aborted, retried = asyncio.run(drive_hung())
+    print(f"hung job: result {hung} | aborted: {aborted} | next job: {retried}")
+    return shared and separate and depth == 1 and in_order and results == ["gainers", "gainers", "losers"] \
+        and hung is None and aborted and retried == "fresh"
+
+def bench_startup(args):
+    """Time imports of the scraper and the bot in fresh interpreters, and the deferred imports they skip"""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        def run_python(code):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                                    check=True, capture_output=True, text=True).stdout
+            return time.perf_counter() - started, output
+
+        for module in ("script", "scrapper_bot"):
+            samples = [run_python(f"import {module}")[0] for _ in range(args.repeat)]
+            print(f"import {module:13} p50 {percentile(samples, 50) * 1000:7.1f}ms | "
+                  f"max {max(samples) * 1000:7.1f}ms (interpreter included)")
+
+        # Touch every deferred module once to see what the first scrape pays for
+        _, output = run_python(
+            "import json, script\n"
+            "for name, module in vars(script).items():\n"
+            "    if isinstance(module, script.LazyModule):\n"
+            "        getattr(module, '__name__')\n"
+            "print(json.dumps(script.IMPORT_TIMINGS))"
+        )
+    for name, seconds in json.loads(output.splitlines()[-1]).items():
+        print(f"  deferred {name:48} {seconds * 1000:7.1f}ms")
+    return True
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+COMMANDS = {
+    "check-details": check_details,
+    "check-resilience": check_resilience,
+    "check-incremental": check_incremental,
+    "check-jobs": check_jobs,
+    "bench-details": bench_details,
+    "bench-bot": bench_bot,
+    "bench-extract": bench_extract,
+    "bench-pipeline": bench_pipeline,
+    "bench-map": bench_map,
+    "bench-screens": bench_screens,
+    "bench-startup": bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline checks and benchmarks for the stock scraper")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--stocks", type=int, default=100, help="number of synthetic stocks")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent fetches")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial server latency in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of fixture requests answered with 503")
+    parser.add_argument("--fixtures", help="directory of recorded pages to serve instead of synthetic ones")
+    parser.add_argument("--screens", type=int, default=4, help="overlapping screens for bench-screens")
+    parser.add_argument("--symbols", type=int, default=10000, help="Trendlyne rows for bench-map")
+    parser.add_argument("--scrips", type=int, default=3000, help="rows in the synthetic margin calculator")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per measurement")
+    parser.add_argument("--engine", choices=["http", "selenium"], default="http", help="detail page engine")
+    parser.add_argument("--concurrent", action="store_true", help="scrape Zerodha and Trendlyne in parallel")
+    parser.add_argument("--warm", action="store_true", help="share caches across runs (steady state)")
+    parser.add_argument("--chats", type=int, default=100, help="simulated Telegram chats")
+    parser.add_argument("--messages", type=int, default=5, help="messages sent by each chat")
+    parser.add_argument("--scrape-seconds", type=float, default=2.0, help="simulated scrape duration")
+    parser.add_argument("--stale", action="store_true", help="expire the snapshot so every query needs a scrape")
+    parser.add_argument("--flood", action="store_true", help="fake Telegram API answers sends over its limits with 429")
+    parser.add_argument("--schedule", action="store_true", help="run the bot's background refresh scheduler")
+    args = parser.parse_args()
+
+    return 0 if COMMANDS[args.command](args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,23 @@
 """
-Telegram Bot - Wrapper for script5.py
-Runs your existing script and returns filtered results
+Telegram Bot - Wrapper for the combined stock scraper
+Runs the scraper in-process and returns filtered results
 """
 
-import requests
 import time
-import subprocess
+STARTED = time.perf_counter()
+
+import asyncio
+import httpx
+import json
+import random
 import os
-import glob
 import logging
-from datetime import datetime
-import pandas as pd
+import threading
+from collections import deque
+from datetime import datetime, time as dt_time, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from script import CombinedStockScraper, DEFAULT_SCREEN, IMPORT_TIMINGS, METRICS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,104 +26,528 @@ logger = logging.getLogger(__name__)
 TELEGRAM_BOT_TOKEN = '"YOUR_TELEGRAM_BOT_TOKEN"'
 TELEGRAM_API_URL = f'URL'
 
-SCRIPT_PATH = "script.py"
-PYTHON_311_PATH = "python"
-subprocess.run([PYTHON_311_PATH, SCRIPT_PATH])
-
 LAST_UPDATE_ID = 0
 
+# Async runtime: updates are handled by a bounded pool of dispatcher tasks
+MAX_CONCURRENT_UPDATES = 16
+MAX_PENDING_UPDATES = 1000
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+POLL_TIMEOUT = 30  # seconds Telegram holds a getUpdates long poll open
+
+# Outbound delivery: token buckets below Telegram's flood limits, retries honour retry_after
+GLOBAL_SEND_RATE = 25         # messages per second across all chats (Telegram allows ~30)
+GLOBAL_SEND_BURST = 5          # keeps any one-second window under Telegram's limit
+CHAT_SEND_RATE = 1            # messages per second to one chat
+CHAT_SEND_BURST = 2
+SEND_RETRIES = 5
+SEND_BACKOFF_BASE = 0.5       # seconds, doubled per attempt, full jitter
+MAX_MESSAGE_LENGTH = 4096     # Telegram's limit for one text message
+MAX_TRACKED_CHATS = 5000      # idle per-chat buckets beyond this are dropped
+
+# Prometheus-style /metrics (and /report for the last run's JSON report); None disables it
+METRICS_PORT = 9108
+
+# Store each run in the scraper's snapshot store; /topN sends a CSV exported from it
+SAVE_FILES = True
+
+# Scrape jobs: identical requests share one run, distinct ones queue for a scrape slot
+MAX_RUNNING_SCRAPES = 1       # each scrape drives its own Chrome instances, so run them one at a time
+REFRESH_COALESCE_WINDOW = 60  # seconds: a /refresh right after a run finished gets that run
+SCRAPE_TIMEOUT = 600          # seconds before a scrape is abandoned and its slot freed for a fresh one
+
+# Chrome drivers started at start-up (with chromedriver resolved), so the first scrape does not pay for them
+WARM_DRIVERS = 2              # one per source; 0 skips the driver warm-up
+
+# Tables rendered once per snapshot, ahead of the first query; other limits are cached on first use
+RENDERED_LIMITS = (10, 25, 50, 100)
+
+# Serve queries from the last scrape for this long before scraping again
+SNAPSHOT_MAX_AGE = 15 * 60  # seconds of market time (a snapshot taken after the close lasts until the next session)
+
+# NSE session; the screens keep updating for a while after the closing bell
+MARKET_TZ = timezone(timedelta(hours=5, minutes=30))  # IST
+MARKET_OPEN = dt_time(9, 15)
+MARKET_CLOSE = dt_time(15, 30)
+MARKET_SETTLE = 20 * 60           # seconds after the close that still count as session time
+MARKET_HOLIDAYS = frozenset()     # weekday dates (datetime.date) the exchange is shut
+
+# Background refresh: re-scrape shortly before the snapshot goes stale so queries find it fresh
+REFRESH_SCHEDULE = True
+SCRAPE_DURATION_ESTIMATE = 8 * 60  # seconds, until a run has been timed
+SCHEDULE_JITTER = 60              # start up to this many seconds early, at random
+SCHEDULE_MIN_GAP = 60             # seconds between the end of one run and the next scheduled start
+SCHEDULE_RETRY_DELAY = 3 * 60     # after a failed scheduled run
+SCHEDULE_MAX_LEAD = 0.8           # start at most this fraction of SNAPSHOT_MAX_AGE before the snapshot goes stale
+MAX_BACK_TO_BACK = 3              # retries or overdue runs in a row before a cooldown
+SCHEDULE_COOLDOWN = 15 * 60
+
 
-def run_script5():
-    """Run script5.py and wait for it to complete"""
-    logger.info("Running script5.py...")
+_scraper = None
+
+
+def get_scraper():
+    """One scraper per process so its driver pool and caches stay warm between runs"""
+    global _scraper
+    if _scraper is None:
+        # Refreshes only visit detail pages of stocks new to the list since the last run
+        _scraper = CombinedStockScraper(concurrent=True, incremental=True)
+    return _scraper
+
+
+def abandon_scraper():
+    """
+    Abort the shared scraper's run after a timeout and drop it, so the next scrape starts on a fresh
+    instance instead of one whose hung run may still hold its drivers
+    """
+    global _scraper
+    scraper, _scraper = _scraper, None
+    if scraper is not None:
+        scraper.abort_event.set()
+
+
+def run_scraper(on_row=None):
+    """
+    Run the scraper in-process, passing each row to on_row(row) as soon as its position is final
+    Returns: (records, run_id, leverage_fallback) - run_id is None when the run is not stored,
+    leverage_fallback is the scraper's note on an older leverage table it fell back to;
+    (None, None, None) on failure
+    """
+    logger.info("Running scraper...")
     try:
-        # Run the script
-        result = subprocess.run(
-            [PYTHON_311_PATH, SCRIPT_PATH],
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minutes timeout
-        )
+        scraper = get_scraper()
+        for row in scraper.scrape_stream(save_files=SAVE_FILES):
+            if on_row:
+                on_row(row)
+        result_df = scraper.last_result
         
-        logger.info("Script execution completed")
-        return True
-    except subprocess.TimeoutExpired:
-        logger.error("Script timeout (10 minutes)")
-        return False
+        if result_df is None or result_df.empty:
+            return None, None, None
+        
+        logger.info("Scraper run completed")
+        return result_df.to_dict('records'), scraper.run_ids.get(DEFAULT_SCREEN), scraper.leverage_fallback
     except Exception as e:
-        logger.error(f"Error running script: {e}")
-        return False
+        logger.error(f"Error running scraper: {e}")
+        return None, None, None
 
 
-def get_latest_csv():
-    """Find the most recently created CSV file from script5"""
-    try:
-        # Look for CSV files in the script directory
-        csv_files = glob.glob(os.path.join(
-            r'C:\Users\sush7\OneDrive\Desktop\WebScrapping',
-            '*.csv'
-        ))
+def market_sessions(start):
+    """
+    Yield (open, close) for each trading session ending after start, close including MARKET_SETTLE
+    Times are aware datetimes in MARKET_TZ
+    """
+    day = start.astimezone(MARKET_TZ).date()
+    while True:
+        if day.weekday() < 5 and day not in MARKET_HOLIDAYS:
+            opens = datetime.combine(day, MARKET_OPEN, MARKET_TZ)
+            closes = datetime.combine(day, MARKET_CLOSE, MARKET_TZ) + timedelta(seconds=MARKET_SETTLE)
+            if closes > start:
+                yield opens, closes
+        day += timedelta(days=1)
+
+
+def market_seconds(start, end):
+    """Seconds of session time between two aware datetimes"""
+    total = 0.0
+    for opens, closes in market_sessions(start):
+        if opens >= end:
+            break
+        total += max(0.0, (min(closes, end) - max(opens, start)).total_seconds())
+    return total
+
+
+def market_deadline(start, seconds):
+    """Wall-clock time at which `seconds` of session time will have passed since start"""
+    if seconds <= 0:
+        return start
+    for opens, closes in market_sessions(start):
+        begin = max(opens, start)
+        span = (closes - begin).total_seconds()
+        if seconds <= span:
+            return begin + timedelta(seconds=seconds)
+        seconds -= span
+
+
+class Snapshot:
+    """
+    One completed scrape: rows as list of dicts plus its run id in the snapshot store
+    Rendered tables and the CSV are cached on it, so they are built once per snapshot
+    """
+    
+    def __init__(self, records, run_id, leverage_fallback=None):
+        self.records = records
+        self.run_id = run_id
+        self.leverage_fallback = leverage_fallback   # older leverage table the run fell back to, if any
+        self.taken_at = time.time()
+        self._csv = None
+        self._tables = {}
+        self.file_id = None   # Telegram's id for the uploaded CSV, to re-send it without uploading
+        self.upload = None    # future of the upload in flight, so concurrent first requests share it
+    
+    def age(self):
+        return time.time() - self.taken_at
+    
+    def market_age(self):
+        """Seconds of session time since the snapshot was taken - prices do not move outside it"""
+        return market_seconds(datetime.fromtimestamp(self.taken_at, MARKET_TZ), datetime.now(MARKET_TZ))
+    
+    def stale_at(self, max_age):
+        """Epoch time when market_age() reaches max_age"""
+        return market_deadline(datetime.fromtimestamp(self.taken_at, MARKET_TZ), max_age).timestamp()
+    
+    def csv_document(self):
+        """
+        (file name, CSV bytes) exported from the snapshot store on first use
+        Returns: None when the run was not stored
+        """
+        if self._csv is None and self.run_id is not None:
+            try:
+                stored = get_scraper().result_store.load(self.run_id)
+            except Exception as e:
+                logger.error(f"Error exporting snapshot #{self.run_id}: {e}")
+                return None
+            if stored:
+                timestamp, screen, result_df = stored
+                csv_name = os.path.basename(get_scraper().output_paths(screen, timestamp)[1])
+                self._csv = (csv_name, result_df.to_csv(index=False).encode('utf-8-sig'))
+        return self._csv
+    
+    def table(self, limit):
+        """The formatted top `limit` table, rendered on first use"""
+        table = self._tables.get(limit)
+        if table is None:
+            table = self._tables[limit] = format_stocks(self.records[:limit], self.leverage_fallback)
+        return table
+    
+    def prerender(self):
+        """Render the common tables and export the CSV before any query asks for them"""
+        for limit in RENDERED_LIMITS:
+            self.table(limit)
+        self.csv_document()
+        return self
+
+
+class SnapshotStore:
+    """
+    Holds the latest snapshot; refreshes are run through SCRAPE_JOBS, which coalesces concurrent ones
+    While a scrape runs, its rows are streamed into `partial` in final order
+    """
+    
+    def __init__(self, max_age=SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.snapshot = None
+        self.partial = []
+        self.last_duration = None
+        self._lock = threading.Lock()
+        self._listeners = set()
+    
+    def subscribe(self, callback):
+        """Call callback() from the scraper thread whenever a row streams in or a refresh ends"""
+        with self._lock:
+            self._listeners.add(callback)
+    
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._listeners.discard(callback)
+    
+    def _notify(self):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback()
+    
+    def _add_row(self, partial, row):
+        partial.append(row)
+        self._notify()
+    
+    def load_latest(self):
+        """Seed an empty store with the last stored run, so a restart can answer without scraping"""
+        if self.snapshot is not None or not SAVE_FILES:
+            return self.snapshot
+        try:
+            scraper = get_scraper()
+            latest = scraper.result_store.latest(DEFAULT_SCREEN) if scraper.result_store else None
+        except Exception as e:
+            logger.error(f"Error loading the stored snapshot: {e}")
+            return None
+        if latest is None:
+            return None
         
-        if not csv_files:
+        run_id, timestamp, result_df = latest
+        snapshot = Snapshot(result_df.to_dict('records'), run_id)
+        snapshot.taken_at = datetime.strptime(timestamp, '%Y%m%d_%H%M%S').timestamp()
+        snapshot.prerender()
+        with self._lock:
+            if self.snapshot is None:
+                self.snapshot = snapshot
+        logger.info(f"Loaded stored snapshot #{run_id} from {timestamp} ({len(snapshot.records)} rows)")
+        return self.snapshot
+    
+    def is_fresh(self):
+        snapshot = self.snapshot
+        return snapshot is not None and snapshot.market_age() < self.max_age
+    
+    def refresh(self):
+        """
+        Run a scrape; returns the new snapshot or None
+        Only call it as a SCRAPE_JOBS job (see start_refresh), which keeps it to one at a time
+        """
+        # Rows go to this run's own list, so a run abandoned on timeout cannot leak into the next one's
+        partial = self.partial = []
+        started = time.time()
+        try:
+            snapshot = self._scrape(partial)
+            if snapshot:
+                self.snapshot = snapshot
+                self.last_duration = time.time() - started
+            return snapshot
+        finally:
+            if self.partial is partial:
+                self.partial = []
+            self._notify()
+    
+    def _scrape(self, partial):
+        records, run_id, leverage_fallback = run_scraper(on_row=lambda row: self._add_row(partial, row))
+        if not records:
             return None
         
-        # Get the most recently modified file
-        latest_csv = max(csv_files, key=os.path.getmtime)
-        logger.info(f"Found CSV: {latest_csv}")
-        return latest_csv
-    except Exception as e:
-        logger.error(f"Error finding CSV: {e}")
-        return None
+        logger.info(f"Snapshot updated with {len(records)} rows")
+        return Snapshot(records, run_id, leverage_fallback).prerender()
 
 
-def read_csv_data(csv_file):
-    """Read CSV and return as list of dicts"""
-    try:
-        df = pd.read_csv(csv_file)
-        return df.to_dict('records')
-    except Exception as e:
-        logger.error(f"Error reading CSV: {e}")
-        return None
+SNAPSHOTS = SnapshotStore()
 
 
-def send_message(chat_id, text):
-    """Send text message"""
-    url = f'{TELEGRAM_API_URL}/sendMessage'
-    try:
-        requests.post(url, json={'chat_id': chat_id, 'text': text}, timeout=10)
-        logger.info(f"Message sent to {chat_id}")
-    except Exception as e:
-        logger.error(f"Error sending message: {e}")
+# Shared keep-alive connection pool, opened by main_async
+_http = None
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts of up to `capacity`"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (Telegram's retry_after)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    def idle(self):
+        """Full again and not paused, so dropping it loses nothing"""
+        now = time.monotonic()
+        return now >= self.blocked_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+    
+    async def acquire(self):
+        """Wait for a token; waiters are served in arrival order"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Split text into chunks of at most `limit` characters, at line breaks where possible"""
+    chunks, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+
+class Outbox:
+    """
+    Outbound Telegram calls: one FIFO per chat so replies keep their order, a sender task per
+    busy chat, and per-chat plus global token buckets in front of every call
+    """
+    
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_BURST)
+        self._queues = {}    # chat_id -> deque of (deliveries, future, queued_at)
+        self._buckets = {}   # chat_id -> TokenBucket
+        self._senders = {}   # chat_id -> sender task
+    
+    def submit(self, chat_id, deliveries):
+        """
+        Queue (method, data, files) calls to go out back to back for one chat
+        Returns: future resolving to the last call's API result (truthy) once all were delivered,
+        False if any was given up on
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append((deliveries, future, time.perf_counter()))
+        
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return future
+    
+    def pending(self):
+        return sum(len(queue) for queue in self._queues.values())
+    
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CHATS:
+                for idle_chat in [chat for chat, b in self._buckets.items()
+                                  if chat not in self._senders and b.idle()]:
+                    del self._buckets[idle_chat]
+            bucket = self._buckets[chat_id] = TokenBucket(CHAT_SEND_RATE, CHAT_SEND_BURST)
+        return bucket
+    
+    async def _drain(self, chat_id):
+        """Sender task for one chat: deliver its queue in order, then exit"""
+        queue = self._queues[chat_id]
+        bucket = self._bucket(chat_id)
+        try:
+            while queue:
+                deliveries, future, queued_at = queue.popleft()
+                METRICS.observe("bot_outbound_wait", time.perf_counter() - queued_at)
+                delivered = True
+                for method, data, files in deliveries:
+                    result = await self._deliver(bucket, method, data, files)
+                    delivered = delivered and result
+                if not future.done():
+                    future.set_result(delivered)
+        finally:
+            del self._senders[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+    
+    async def _deliver(self, bucket, method, data, files):
+        """
+        One API call with rate limiting and retries
+        Returns: the call's result (True if it has none) if Telegram accepted it, else False
+        """
+        url = f'{TELEGRAM_API_URL}/{method}'
+        chat_id = data['chat_id']
+        
+        for attempt in range(SEND_RETRIES):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                if files:
+                    resp = await _http.post(url, data=data, files=files, timeout=30)
+                else:
+                    resp = await _http.post(url, json=data, timeout=10)
+            except Exception as e:
+                delay = random.uniform(0, SEND_BACKOFF_BASE * 2 ** attempt)
+                logger.warning(f"{method} to {chat_id} failed ({e}), retrying in {delay:.1f}s")
+                METRICS.inc("bot_outbound_total", method=method, result="retried")
+                await asyncio.sleep(delay)
+                continue
+            
+            if resp.status_code == 429:
+                # Flood control: wait exactly as long as Telegram asks before this chat sends again
+                try:
+                    retry_after = resp.json().get('parameters', {}).get('retry_after', 1)
+                except ValueError:
+                    retry_after = 1
+                logger.warning(f"Flood limit for {chat_id}, retrying {method} in {retry_after}s")
+                METRICS.inc("bot_outbound_total", method=method, result="rate_limited")
+                bucket.pause(retry_after)
+                continue
+            
+            if resp.status_code >= 500:
+                delay = random.uniform(0, SEND_BACKOFF_BASE * 2 ** attempt)
+                METRICS.inc("bot_outbound_total", method=method, result="retried")
+                await asyncio.sleep(delay)
+                continue
+            
+            if resp.status_code >= 400:
+                logger.error(f"{method} to {chat_id} rejected: {resp.status_code} {resp.text[:200]}")
+                METRICS.inc("bot_outbound_total", method=method, result="rejected")
+                return False
+            
+            logger.info(f"{method} delivered to {chat_id}")
+            METRICS.inc("bot_outbound_total", method=method, result="ok")
+            try:
+                return resp.json().get('result') or True
+            except ValueError:
+                return True
+        
+        logger.error(f"Giving up on {method} to {chat_id} after {SEND_RETRIES} attempts")
+        METRICS.inc("bot_outbound_total", method=method, result="failed")
+        return False
+
+
+OUTBOX = Outbox()
+
+
+async def send_message(chat_id, text):
+    """Queue a text message; texts over Telegram's limit go out as several messages, in order"""
+    chunks = split_message(text)
+    return OUTBOX.submit(chat_id, [('sendMessage', {'chat_id': chat_id, 'text': chunk}, None) for chunk in chunks])
+
 
+async def send_document(chat_id, document):
+    """
+    Queue a file for the user, after any messages already queued for the chat
+    document: (file name, bytes) to upload, or the file_id of a file Telegram already has
+    """
+    if isinstance(document, str):
+        return OUTBOX.submit(chat_id, [('sendDocument', {'chat_id': chat_id, 'document': document}, None)])
+    files = {'document': document}
+    return OUTBOX.submit(chat_id, [('sendDocument', {'chat_id': str(chat_id)}, files)])
 
-def send_document(chat_id, file_path):
-    """Send CSV file to user"""
-    url = f'{TELEGRAM_API_URL}/sendDocument'
+
+async def send_snapshot_csv(chat_id, snapshot):
+    """Send the snapshot's CSV: uploaded once, then re-sent by file_id"""
+    # Concurrent first requests wait for the one upload instead of each sending the file
+    while snapshot.upload is not None and not snapshot.upload.done():
+        await asyncio.shield(snapshot.upload)
+    
+    if snapshot.file_id:
+        METRICS.inc("bot_documents_total", source="file_id")
+        await send_document(chat_id, snapshot.file_id)
+        return
+    
+    snapshot.upload = asyncio.get_running_loop().create_future()
     try:
-        with open(file_path, 'rb') as f:
-            files = {'document': f}
-            requests.post(url, data={'chat_id': chat_id}, files=files, timeout=30)
-        logger.info(f"Document sent to {chat_id}")
-    except Exception as e:
-        logger.error(f"Error sending document: {e}")
+        document = await asyncio.to_thread(snapshot.csv_document)
+        if document:
+            METRICS.inc("bot_documents_total", source="upload")
+            result = await (await send_document(chat_id, document))
+            if isinstance(result, dict):
+                snapshot.file_id = result.get('document', {}).get('file_id')
+    finally:
+        snapshot.upload.set_result(None)
 
 
-def get_updates(offset=0):
-    """Get new messages from Telegram"""
+async def get_updates(offset=0):
+    """Get new messages from Telegram (None if the request failed)"""
     url = f'{TELEGRAM_API_URL}/getUpdates'
     try:
-        resp = requests.get(url, params={'offset': offset, 'timeout': 30}, timeout=40)
+        resp = await _http.get(url, params={'offset': offset, 'timeout': POLL_TIMEOUT}, timeout=POLL_TIMEOUT + 10)
         return resp.json().get('result', [])
     except Exception as e:
         logger.error(f"Error getting updates: {e}")
-        return []
+        return None
 
 
-def format_stocks(stocks):
-    """Format stocks for display"""
-    message = "Top Gainers with Leverage\n\n"
-    message += "Stock Name                    NSE      Leverage\n"
-    message += "-" * 60 + "\n"
+def format_stocks(stocks, leverage_fallback=None):
+    """Format stocks for display, noting when leverage comes from an older Zerodha table"""
+    lines = ["Top Gainers with Leverage", "", "Stock Name                    NSE      Leverage", "-" * 60]
     
     for idx, stock in enumerate(stocks, 1):
         # Handle different column names
@@ -128,17 +559,292 @@ def format_stocks(stocks):
         nse_str = str(nse)[:8].ljust(8)
         lev_str = str(lev)
         
-        message += f"{idx:2}. {name_str} {nse_str} {lev_str}\n"
+        lines.append(f"{idx:2}. {name_str} {nse_str} {lev_str}")
+    
+    lines.append("")
+    if leverage_fallback:
+        cause = "Zerodha's table looked incomplete" if leverage_fallback.get("reason") == "incomplete" \
+            else "Zerodha was unavailable"
+        lines.append(f"Note: {cause}, leverage is from table {leverage_fallback['version']} "
+                     f"({leverage_fallback['age_s'] / 3600:.1f} h old)")
+    return "\n".join(lines)
+
+
+class ScrapeJobs:
+    """
+    Job queue for scrapes with single-flight de-duplication
+    While a job for a key is queued or running, every request for that key subscribes to it and
+    gets its result, so any number of simultaneous askers costs one scrape; jobs for different
+    keys wait in arrival order for one of max_running slots
+    A job running past timeout resolves to None and frees its slot
+    """
+    
+    def __init__(self, max_running=MAX_RUNNING_SCRAPES, timeout=SCRAPE_TIMEOUT):
+        self.max_running = max_running
+        self.timeout = timeout
+        self._slots = None       # semaphore, created on the running loop
+        self._jobs = {}          # key -> task
+        self._subscribers = {}   # key -> requests served by the job
+        self._queued = 0
+        self._running = 0
+    
+    def submit(self, key, work, abort=None):
+        """
+        Subscribe to the job for key, queueing one that runs work() in a thread if there is none
+        abort() is called if the job times out, to stop the thread it leaves behind
+        Returns: the job's task, resolving to work()'s result (None on timeout)
+        """
+        task = self._jobs.get(key)
+        if task is None:
+            task = self._jobs[key] = asyncio.create_task(self._run(key, work, abort))
+            self._subscribers[key] = 0
+            METRICS.inc("bot_scrape_requests_total", result="started")
+        else:
+            METRICS.inc("bot_scrape_requests_total", result="coalesced")
+        self._subscribers[key] += 1
+        
+        subscribed_at = time.perf_counter()
+        task.add_done_callback(
+            lambda _: METRICS.observe("bot_scrape_subscriber_wait", time.perf_counter() - subscribed_at))
+        self._publish()
+        return task
     
-    return message
+    def depth(self):
+        """Jobs waiting for a slot"""
+        return self._queued
+    
+    def _publish(self):
+        METRICS.set_gauge("bot_scrape_jobs", self._queued, state="queued")
+        METRICS.set_gauge("bot_scrape_jobs", self._running, state="running")
+        METRICS.set_gauge("bot_scrape_subscribers", sum(self._subscribers.values()))
+    
+    async def _run(self, key, work, abort):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+        queued_at = time.perf_counter()
+        self._queued += 1
+        self._publish()
+        try:
+            try:
+                await self._slots.acquire()
+            finally:
+                self._queued -= 1
+            
+            METRICS.observe("bot_scrape_job_wait", time.perf_counter() - queued_at)
+            self._running += 1
+            self._publish()
+            try:
+                return await asyncio.wait_for(asyncio.to_thread(work), self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Scrape job {key} timed out after {self.timeout}s, abandoning it")
+                METRICS.inc("bot_scrape_timeouts_total")
+                if abort:
+                    abort()
+                return None
+            finally:
+                self._running -= 1
+                self._slots.release()
+        finally:
+            del self._jobs[key]
+            self._subscribers.pop(key, None)
+            self._publish()
+
+
+SCRAPE_JOBS = ScrapeJobs()
+_background_tasks = set()
+
+
+def run_in_background(coro):
+    """Run a slow reply as its own task so it does not hold a dispatcher slot"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def start_refresh():
+    """Return the shared refresh job, queueing one if none is queued or running"""
+    return SCRAPE_JOBS.submit(DEFAULT_SCREEN, SNAPSHOTS.refresh, abort=abandon_scraper)
+
+
+async def get_snapshot(force=False):
+    """
+    Await a snapshot without blocking the event loop
+    All callers waiting on a scrape share the same in-flight refresh
+    """
+    if not force and SNAPSHOTS.is_fresh():
+        return SNAPSHOTS.snapshot
+    return await asyncio.shield(start_refresh())
+
+
+async def wait_for_rows(refresh, limit):
+    """
+    Await the top `limit` rows of the running refresh: as soon as they have streamed in,
+    or from its snapshot once it ends with fewer rows
+    Returns: rows (None if the scrape failed)
+    """
+    loop = asyncio.get_running_loop()
+    progress = asyncio.Event()
+    
+    def on_progress():
+        loop.call_soon_threadsafe(progress.set)
+    
+    SNAPSHOTS.subscribe(on_progress)
+    try:
+        while True:
+            # Clear before checking so a row landing in between still wakes us
+            progress.clear()
+            if len(SNAPSHOTS.partial) >= limit:
+                return SNAPSHOTS.partial[:limit]
+            if refresh.done():
+                snapshot = refresh.result()
+                return snapshot.records[:limit] if snapshot else None
+            
+            waiter = asyncio.ensure_future(progress.wait())
+            try:
+                await asyncio.wait({refresh, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+    finally:
+        SNAPSHOTS.unsubscribe(on_progress)
+
+
+async def reply_top_stocks(chat_id, limit):
+    """Send the top `limit` rows as soon as they are known, then the CSV once the scrape has finished"""
+    if SNAPSHOTS.is_fresh():
+        snapshot = SNAPSHOTS.snapshot
+        message = snapshot.table(limit)
+    else:
+        refresh = start_refresh()
+        stocks = await wait_for_rows(refresh, limit)
+        snapshot = None
+        # Streamed rows are mapped, so the run has already settled on its leverage table
+        message = format_stocks(stocks, get_scraper().leverage_fallback) if stocks else None
+    
+    if not message:
+        await send_message(chat_id, "Error running scraper")
+        return
+    
+    await send_message(chat_id, message)
+    
+    # Send CSV (an early answer waits for the run that writes it)
+    if snapshot is None:
+        snapshot = await asyncio.shield(refresh)
+    if snapshot:
+        await send_snapshot_csv(chat_id, snapshot)
+
 
+async def send_top_stocks(chat_id, limit, scraping_notice):
+    """Reply with the top `limit` rows from the current snapshot, scraping in the background if it is stale"""
+    if SNAPSHOTS.is_fresh():
+        METRICS.inc("bot_queries_total", snapshot="fresh")
+        await reply_top_stocks(chat_id, limit)
+        return
+    
+    METRICS.inc("bot_queries_total", snapshot="stale")
+    await send_message(chat_id, scraping_notice)
+    run_in_background(reply_top_stocks(chat_id, limit))
+
+
+async def refresh_and_notify(chat_id):
+    """Force a scrape and tell the chat how it went; a run that has only just finished counts"""
+    snapshot = SNAPSHOTS.snapshot
+    if snapshot is None or snapshot.age() >= REFRESH_COALESCE_WINDOW:
+        snapshot = await get_snapshot(force=True)
+    else:
+        METRICS.inc("bot_scrape_requests_total", result="recent")
+    
+    if snapshot:
+        await send_message(chat_id, "Scraping complete! Getting data...")
+    else:
+        await send_message(chat_id, "Error running scraper. Try again.")
+
+
+def next_refresh_delay():
+    """
+    Seconds until the next scheduled scrape should start so that it finishes, with the last run's
+    duration to spare, before the current snapshot goes stale; 0 when there is no snapshot
+    """
+    snapshot = SNAPSHOTS.snapshot
+    if snapshot is None:
+        return 0.0
+    
+    lead = (SNAPSHOTS.last_duration or SCRAPE_DURATION_ESTIMATE) * 1.25 + random.uniform(0, SCHEDULE_JITTER)
+    # A slow run must not push the start back to the snapshot itself, which would scrape around the clock
+    lead = min(lead, SNAPSHOTS.max_age * SCHEDULE_MAX_LEAD)
+    return max(0.0, snapshot.stale_at(SNAPSHOTS.max_age - lead) - time.time())
+
+
+async def refresh_scheduler():
+    """
+    Keep a fresh snapshot ready: scrape through the same shared refresh as /refresh, so a scheduled
+    run never overlaps a user's. Runs that start earlier than planned - retries, or runs already
+    overdue because scrapes cannot keep up - count as back to back; after MAX_BACK_TO_BACK of
+    them in a row, rest for SCHEDULE_COOLDOWN
+    """
+    back_to_back = 0
+    last_end = None
+    failed = False
+    
+    while True:
+        if failed:
+            delay = SCHEDULE_RETRY_DELAY * random.uniform(0.8, 1.2)
+            early = True
+        else:
+            planned = next_refresh_delay()
+            early = last_end is not None and planned < SCHEDULE_MIN_GAP
+            delay = max(SCHEDULE_MIN_GAP, planned) if last_end is not None else planned
+        if early and back_to_back >= MAX_BACK_TO_BACK:
+            logger.info(f"{back_to_back} scrapes back to back, cooling down")
+            delay = max(delay, SCHEDULE_COOLDOWN)
+            back_to_back = 0
+        
+        if delay > 0:
+            logger.info(f"Next scheduled scrape in {delay / 60:.1f} min")
+            snapshot = SNAPSHOTS.snapshot
+            await asyncio.sleep(delay)
+            # A user's /refresh landed meanwhile: reschedule from the new snapshot
+            if SNAPSHOTS.snapshot is not snapshot:
+                failed = False
+                continue
+        
+        back_to_back = back_to_back + 1 if early else 0
+        snapshot = await get_snapshot(force=True)
+        last_end = time.time()
+        failed = snapshot is None
+        METRICS.inc("bot_scheduled_refreshes_total", result="failed" if failed else "ok")
 
-def process_message(message_text, chat_id):
+
+async def warm_up():
+    """
+    Start-up work kept off the polling path: load the scraper (and its deferred imports)
+    with the last stored snapshot, resolve chromedriver and start WARM_DRIVERS drivers,
+    then keep the snapshot fresh - or scrape once when not scheduling
+    """
+    started = time.perf_counter()
+    await asyncio.to_thread(SNAPSHOTS.load_latest)
+    if WARM_DRIVERS:
+        try:
+            await asyncio.to_thread(get_scraper().driver_pool.warm, WARM_DRIVERS)
+        except Exception as e:
+            # The first scrape starts its own drivers instead
+            logger.error(f"Driver warm-up failed: {e}")
+    METRICS.observe("bot_warm_up", time.perf_counter() - started)
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in IMPORT_TIMINGS.items())
+    logger.info(f"Warm-up done in {time.perf_counter() - started:.2f}s (deferred imports: {imports or 'none'})")
+    
+    if REFRESH_SCHEDULE:
+        await refresh_scheduler()
+    elif not SNAPSHOTS.is_fresh():
+        await get_snapshot()
+
+
+async def process_message(message_text, chat_id):
     """Process incoming messages"""
     text = message_text.strip().lower()
     
     if text == '/start':
-        send_message(chat_id, """Stock Scraper Bot
+        await send_message(chat_id, """Stock Scraper Bot
 
 Send a number (1-100) to get top X gainers:
 Example: 20 (for top 20 gainers)
@@ -151,127 +857,127 @@ Commands:
 /refresh - Run fresh scrape""")
     
     elif text == '/refresh':
-        send_message(chat_id, "Running scraper... This may take 5-10 minutes. Please wait...")
-        
-        success = run_script5()
-        
-        if success:
-            time.sleep(2)
-            csv_file = get_latest_csv()
-            if csv_file:
-                send_message(chat_id, "Scraping complete! Getting data...")
-            else:
-                send_message(chat_id, "Scraping complete but couldn't find CSV file")
-        else:
-            send_message(chat_id, "Error running scraper. Try again.")
+        await send_message(chat_id, "Running scraper... This may take 5-10 minutes. Please wait...")
+        run_in_background(refresh_and_notify(chat_id))
     
     elif text in ['/top10', '/top25', '/top50', '/all']:
         limits = {'/top10': 10, '/top25': 25, '/top50': 50, '/all': 100}
-        limit = limits[text]
-        
-        send_message(chat_id, f"Fetching top {limit}...")
-        
-        # Run script
-        success = run_script5()
-        
-        if not success:
-            send_message(chat_id, "Error running scraper")
-            return
-        
-        time.sleep(2)
-        
-        # Get CSV
-        csv_file = get_latest_csv()
-        if not csv_file:
-            send_message(chat_id, "Error: CSV file not found")
-            return
-        
-        # Read data
-        data = read_csv_data(csv_file)
-        if not data:
-            send_message(chat_id, "Error reading data")
-            return
-        
-        # Limit and format
-        stocks = data[:limit]
-        message = format_stocks(stocks)
-        send_message(chat_id, message)
-        
-        # Send CSV
-        send_document(chat_id, csv_file)
+        await send_top_stocks(chat_id, limits[text], f"Fetching top {limits[text]}...")
     
     elif text.isdigit():
         limit = int(text)
         if 1 <= limit <= 100:
-            send_message(chat_id, f"Fetching top {limit} gainers...")
-            
-            # Run script
-            success = run_script5()
-            
-            if not success:
-                send_message(chat_id, "Error running scraper")
-                return
-            
-            time.sleep(2)
-            
-            # Get CSV
-            csv_file = get_latest_csv()
-            if not csv_file:
-                send_message(chat_id, "Error: CSV file not found")
-                return
-            
-            # Read data
-            data = read_csv_data(csv_file)
-            if not data:
-                send_message(chat_id, "Error reading data")
-                return
-            
-            # Limit and format
-            stocks = data[:limit]
-            message = format_stocks(stocks)
-            send_message(chat_id, message)
-            
-            # Send CSV
-            send_document(chat_id, csv_file)
+            await send_top_stocks(chat_id, limit, f"Fetching top {limit} gainers...")
         else:
-            send_message(chat_id, "Please send a number between 1 and 100")
+            await send_message(chat_id, "Please send a number between 1 and 100")
     
     else:
-        send_message(chat_id, "Unknown command. Send /start for help")
+        await send_message(chat_id, "Unknown command. Send /start for help")
 
 
-def main():
-    """Main bot loop"""
-    global LAST_UPDATE_ID
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve scraper and bot metrics to Prometheus"""
     
-    if TELEGRAM_BOT_TOKEN == 'YOUR_TELEGRAM_BOT_TOKEN_HERE':
-        print("ERROR: Replace TELEGRAM_BOT_TOKEN with your actual token!")
-        return
-    
-    if not os.path.exists(SCRIPT_PATH):
-        print(f"ERROR: script5.py not found at {SCRIPT_PATH}")
-        return
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = METRICS.to_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/report':
+            report = _scraper.last_report if _scraper else None
+            body = json.dumps(report or {}).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
-    logger.info("Bot started. Waiting for messages...")
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics and /report from a background thread"""
+    if port is None:
+        return None
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on port {port}: {e}")
+        return None
     
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics available on :{port}/metrics")
+    return server
+
+
+async def update_worker(update_queue):
+    """Dispatcher task: handle queued messages one at a time"""
     while True:
+        text, chat_id = await update_queue.get()
         try:
-            updates = get_updates(LAST_UPDATE_ID)
-            
-            for update in updates:
-                LAST_UPDATE_ID = update['update_id'] + 1
-                
-                if 'message' in update and 'text' in update['message']:
-                    chat_id = update['message']['chat']['id']
-                    text = update['message']['text']
-                    logger.info(f"Message from {chat_id}: {text}")
-                    process_message(text, chat_id)
-            
-            time.sleep(1)
-        
+            with METRICS.time("bot_handle_message"):
+                await process_message(text, chat_id)
+            METRICS.inc("bot_messages_total", result="ok")
         except Exception as e:
-            logger.error(f"Main loop error: {e}")
-            time.sleep(5)
+            METRICS.inc("bot_messages_total", result="error")
+            logger.error(f"Error handling message from {chat_id}: {e}")
+        finally:
+            update_queue.task_done()
+
+
+async def main_async():
+    """Long-poll Telegram and hand messages to the dispatcher tasks"""
+    global LAST_UPDATE_ID, _http
+    
+    async with httpx.AsyncClient(limits=HTTP_LIMITS) as client:
+        _http = client
+        update_queue = asyncio.Queue(maxsize=MAX_PENDING_UPDATES)
+        workers = [asyncio.create_task(update_worker(update_queue)) for _ in range(MAX_CONCURRENT_UPDATES)]
+        workers.append(asyncio.create_task(warm_up()))
+        
+        # Time from process start until the first poll goes out
+        startup = time.perf_counter() - STARTED
+        METRICS.observe("bot_startup", startup)
+        logger.info(f"Bot started in {startup:.2f}s. Waiting for messages...")
+        
+        try:
+            while True:
+                try:
+                    updates = await get_updates(LAST_UPDATE_ID)
+                    if updates is None:
+                        await asyncio.sleep(5)
+                        continue
+                    
+                    for update in updates:
+                        LAST_UPDATE_ID = update['update_id'] + 1
+                        
+                        if 'message' in update and 'text' in update['message']:
+                            chat_id = update['message']['chat']['id']
+                            text = update['message']['text']
+                            logger.info(f"Message from {chat_id}: {text}")
+                            await update_queue.put((text, chat_id))
+                
+                except Exception as e:
+                    logger.error(f"Main loop error: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+def main():
+    """Main bot entry point"""
+    if TELEGRAM_BOT_TOKEN == 'YOUR_TELEGRAM_BOT_TOKEN_HERE':
+        print("ERROR: Replace TELEGRAM_BOT_TOKEN with your actual token!")
+        return
+    
+    start_metrics_server()
+    asyncio.run(main_async())
 
 
 if __name__ == '__main__':
@@ -3,23 +3,70 @@ Automated Stock Scraper for Trendlyne Top Gainers (3-Month) and Zerodha 5x Lever
 Combines live data from both sources with real-time mapping
 
 Requirements:
-pip install selenium pandas openpyxl webdriver-manager
+pip install selenium pandas openpyxl webdriver-manager requests
 
-Output: Excel/CSV with columns: Stock Name | NSE | Leverage
+Output: snapshots in results.db with columns: Stock Name | NSE | Leverage
+        (--export writes Excel/CSV for the run, --export-latest for the stored snapshot;
+        --incremental only visits detail pages of stocks new to the list since the last run)
 """
 
+import os
 import time
-import pandas as pd
+import importlib
 import logging
 import sys
+import threading
+import atexit
+import json
+from collections import deque
+from contextlib import contextmanager
+import queue
+import random
+import re
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+from selenium.common.exceptions import TimeoutException
+
+# Heavy modules are imported on first use, so importing this module (and starting the bot) stays fast
+IMPORT_TIMINGS = {}  # module name -> seconds its deferred import took
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            IMPORT_TIMINGS[self._name] = time.perf_counter() - started
+            logging.debug(f"Imported {self._name} in {IMPORT_TIMINGS[self._name]:.3f}s")
+        return getattr(self._module, attr)
+
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+requests = LazyModule("requests")
+# selenium.webdriver imports every browser's bindings; selenium.common.exceptions alone is cheap
+webdriver = LazyModule("selenium.webdriver")
+selenium_by = LazyModule("selenium.webdriver.common.by")
+chrome_service = LazyModule("selenium.webdriver.chrome.service")
+chrome_options = LazyModule("selenium.webdriver.chrome.options")
+selenium_ui = LazyModule("selenium.webdriver.support.ui")
+EC = LazyModule("selenium.webdriver.support.expected_conditions")
+webdriver_manager = LazyModule("webdriver_manager.chrome")
+
+try:
+    import psutil
+except ImportError:  # memory-based driver recycling is skipped without psutil
+    psutil = None
 
 # Fix Unicode encoding for Windows console
 if sys.platform == 'win32':
@@ -35,30 +82,1235 @@ logging.basicConfig(
     ]
 )
 
+TRENDLYNE_URL = "https://trendlyne.com/stock-screeners/price-based/top-gainers/3-month/index/NIFTY500/nifty-500/"
+ZERODHA_URL = "https://zerodha.com/margin-calculator/Equity/"
+
+# Screens for the multi-screen run mode (name -> URL); names double as output file tags
+TRENDLYNE_SCREEN_URL = "https://trendlyne.com/stock-screeners/price-based/top-gainers/{period}/index/{index}/{index_slug}/"
+TRENDLYNE_SCREENS = {
+    f"{period}-nifty-500": TRENDLYNE_SCREEN_URL.format(period=period, index="NIFTY500", index_slug="nifty-500")
+    for period in ("1-week", "1-month", "3-month", "6-month")
+}
+SCREEN_WORKERS = 4            # screen list pages loaded in parallel, one pooled Chrome each
+
+# Stocks whose Zerodha MIS multiplier is at least this get their leverage shown, others NA
+MIN_LEVERAGE = 5
+
+# Default number of parallel browser workers for stock detail pages
+DETAIL_WORKERS = 4
+
+# Detail page engine: "http" tries a plain pooled HTTP fetch first and only
+# falls back to Selenium for pages it cannot parse; "selenium" always renders
+DETAIL_ENGINE = "http"
+HTTP_DETAIL_WORKERS = 16
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+# Timeout budget in seconds for each wait stage; waits return as soon as their condition is met
+WAIT_TIMEOUTS = {
+    "zerodha_table": 15,      # first tr[data-scrip] rows present
+    "zerodha_rows": 20,       # row count stops growing while scrolling
+    "trendlyne_page": 15,     # entries dropdown or table rows present
+    "trendlyne_expand": 10,   # table redraws after selecting 100 entries
+    "trendlyne_rows": 30,     # row count stops growing while scrolling
+    "detail_page": 10,        # span.stock_info_heading present
+}
+WAIT_POLL_INTERVAL = 0.25
+WAIT_STABLE_POLLS = 4         # a row count is "stable" after this many unchanged polls
+
+# Page fetches are retried with jittered exponential backoff behind a circuit breaker per host
+FETCH_RETRIES = 3             # attempts per page; detail pages that still fail are re-queued once at the end
+FETCH_BACKOFF_BASE = 0.5      # seconds, doubled per attempt, full jitter
+FETCH_BACKOFF_MAX = 8.0
+BREAKER_SETTINGS = {
+    "max_concurrency": 16,    # in-flight fetches per host
+    "window": 50,             # recent calls the failure ratio is measured over
+    "failure_ratio": 0.6,     # share of failed calls in a full window that opens the breaker
+    "reset_timeout": 30,      # seconds an open breaker rejects calls before letting one probe through
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose breaker is open"""
+
+
+class PageParseError(Exception):
+    """The page loaded but the expected fields were missing; not retried, and not counted against the host"""
+
+
+def backoff_delay(attempt, base=FETCH_BACKOFF_BASE, cap=FETCH_BACKOFF_MAX):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    """
+    Client errors other than timeouts and rate limiting will not go away on retry, nor will a page
+    that loaded without the expected fields
+    """
+    if isinstance(error, PageParseError):
+        return False
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code >= 500 or response.status_code in (408, 429)
+    return not isinstance(error, CircuitOpenError)
+
+
+class HostBreaker:
+    """Circuit breaker and concurrency limiter for one host"""
+    
+    def __init__(self, host, max_concurrency, window, failure_ratio, reset_timeout):
+        self.host = host
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.outcomes = deque(maxlen=window)   # True for each recent success
+        self.opened_at = None
+        self._probe = None     # token of the one call let through while half-open
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if self.retry_after() > 0 else "half_open"
+    
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through (0 when closed or half-open)"""
+        opened_at = self.opened_at
+        if opened_at is None:
+            return 0
+        return max(0.0, opened_at + self.reset_timeout - time.time())
+    
+    @contextmanager
+    def call(self):
+        """Guard one fetch: raises CircuitOpenError while open, otherwise waits for a free slot"""
+        token = None
+        with self._lock:
+            if self.opened_at is not None:
+                if self.retry_after() > 0 or self._probe is not None:
+                    raise CircuitOpenError(f"Circuit open for {self.host}")
+                token = self._probe = object()
+        
+        with self._slots:
+            try:
+                yield
+            except PageParseError:
+                self._record(ok=True, token=token)
+                raise
+            except Exception:
+                self._record(ok=False, token=token)
+                raise
+            self._record(ok=True, token=token)
+    
+    def _record(self, ok, token=None):
+        """Only the probe's own outcome closes or re-opens a half-open breaker; stragglers are just counted"""
+        with self._lock:
+            probe = token is not None and token is self._probe
+            if probe:
+                self._probe = None
+            if probe and ok:
+                logging.info(f"Circuit closed for {self.host}")
+                self.opened_at = None
+                self.outcomes.clear()
+            self.outcomes.append(ok)
+            
+            if ok or (self.opened_at is not None and not probe):
+                return
+            failures = self.outcomes.count(False)
+            full = len(self.outcomes) == self.outcomes.maxlen
+            if probe or (full and failures >= self.failure_ratio * len(self.outcomes)):
+                self.opened_at = time.time()
+                logging.warning(f"Circuit opened for {self.host} after {failures}/{len(self.outcomes)} "
+                                f"failed calls, retrying in {self.reset_timeout}s")
+
+# Persistent URL -> (name, NSE) cache so detail pages are only visited for new or stale symbols
+SYMBOL_CACHE_PATH = "symbol_cache.db"
+SYMBOL_CACHE_TTL = 7 * 24 * 3600      # revalidate entries older than a week
+SYMBOL_CACHE_MAX_ENTRIES = 5000       # least recently used entries beyond this are evicted
+
+
+class SymbolCache:
+    """SQLite cache mapping a Trendlyne stock URL to its full name, NSE code and last verification time"""
+    
+    def __init__(self, path=SYMBOL_CACHE_PATH, ttl=SYMBOL_CACHE_TTL, max_entries=SYMBOL_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS symbols (
+                    url TEXT PRIMARY KEY,
+                    full_name TEXT NOT NULL,
+                    nse_code TEXT NOT NULL,
+                    verified_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_last_used ON symbols (last_used_at)")
+            self._conn.commit()
+        return self._conn
+    
+    def lookup(self, urls):
+        """
+        Look up cached entries for the given URLs and mark them as used
+        Returns: (fresh, stale) - dicts of url -> (full_name, nse_code)
+        """
+        fresh, stale = {}, {}
+        if not urls:
+            return fresh, stale
+        
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT url, full_name, nse_code, verified_at FROM symbols WHERE url IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for url, full_name, nse_code, verified_at in rows:
+                    target = fresh if now - verified_at < self.ttl else stale
+                    target[url] = (full_name, nse_code)
+                conn.execute(f"UPDATE symbols SET last_used_at = ? WHERE url IN ({placeholders})", [now] + chunk)
+            conn.commit()
+        
+        return fresh, stale
+    
+    def store(self, entries):
+        """Insert or revalidate entries given as (url, full_name, nse_code), then evict past max_entries"""
+        if not entries:
+            return
+        
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO symbols (url, full_name, nse_code, verified_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                [(url, full_name, nse_code, now, now) for url, full_name, nse_code in entries]
+            )
+            
+            # Evict least recently used entries past the size limit
+            conn.execute("""
+                DELETE FROM symbols WHERE url IN (
+                    SELECT url FROM symbols ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            conn.commit()
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Versioned history of every scrip's Zerodha MIS multiplier; margin tables change at most daily
+LEVERAGE_INDEX_PATH = "leverage_index.db"
+LEVERAGE_INDEX_TTL = 12 * 3600        # reuse the latest version for this long without relaunching Chrome
+LEVERAGE_INDEX_KEEP_VERSIONS = 30     # older versions are pruned
+LEVERAGE_FALLBACK_MAX_AGE = 3 * 24 * 3600   # when Zerodha fails, an older version is used up to this age
+LEVERAGE_MAX_REMOVED = 0.1            # a scrape missing more than this share of the previous scrips is not saved
+
+
+class LeverageIndex:
+    """SQLite index of Zerodha multipliers, one version per scrape, diffed against the previous version"""
+    
+    def __init__(self, path=LEVERAGE_INDEX_PATH, ttl=LEVERAGE_INDEX_TTL, keep_versions=LEVERAGE_INDEX_KEEP_VERSIONS,
+                 max_removed=LEVERAGE_MAX_REMOVED):
+        self.path = path
+        self.ttl = ttl
+        self.keep_versions = keep_versions
+        self.max_removed = max_removed
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS versions (
+                    version TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    scrip_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS multipliers (
+                    version TEXT NOT NULL,
+                    scrip TEXT NOT NULL,
+                    multiplier TEXT NOT NULL,
+                    PRIMARY KEY (version, scrip)
+                );
+            """)
+        return self._conn
+    
+    def _load(self, conn, version):
+        rows = conn.execute("SELECT scrip, multiplier FROM multipliers WHERE version = ?", (version,))
+        return dict(rows.fetchall())
+    
+    def latest(self, max_age=None):
+        """
+        Latest version, optionally only if it is younger than max_age seconds
+        Returns: (version, created_at, {scrip: multiplier}) or None
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT version, created_at FROM versions ORDER BY created_at DESC LIMIT 1").fetchone()
+            if row is None:
+                return None
+            version, created_at = row
+            if max_age is not None and time.time() - created_at >= max_age:
+                return None
+            return version, created_at, self._load(conn, version)
+    
+    @staticmethod
+    def diff(old, new):
+        """Compare two {scrip: multiplier} maps"""
+        return {
+            "added": {scrip: new[scrip] for scrip in new.keys() - old.keys()},
+            "removed": {scrip: old[scrip] for scrip in old.keys() - new.keys()},
+            "changed": {scrip: (old[scrip], new[scrip]) for scrip in new.keys() & old.keys()
+                        if old[scrip] != new[scrip]},
+        }
+    
+    def save(self, multipliers):
+        """
+        Store a new version and prune old ones, unless it drops more than max_removed of the
+        previous version's scrips - then the previous version stays the latest
+        Returns: (version or None if not stored, diff against the previous version)
+        """
+        now = time.time()
+        version = datetime.fromtimestamp(now).strftime('%Y%m%d_%H%M%S_%f')
+        
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT version FROM versions ORDER BY created_at DESC LIMIT 1").fetchone()
+            previous = self._load(conn, row[0]) if row else {}
+            diff = self.diff(previous, multipliers)
+            if previous and len(diff["removed"]) > self.max_removed * len(previous):
+                return None, diff
+            
+            conn.execute("INSERT INTO versions (version, created_at, scrip_count) VALUES (?, ?, ?)",
+                         (version, now, len(multipliers)))
+            conn.executemany("INSERT INTO multipliers (version, scrip, multiplier) VALUES (?, ?, ?)",
+                             [(version, scrip, multiplier) for scrip, multiplier in multipliers.items()])
+            
+            # Keep only the newest keep_versions versions
+            conn.execute("""
+                DELETE FROM versions WHERE version IN (
+                    SELECT version FROM versions ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.keep_versions,))
+            conn.execute("DELETE FROM multipliers WHERE version NOT IN (SELECT version FROM versions)")
+            conn.commit()
+        
+        return version, diff
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class LeverageTable(dict):
+    """
+    NSE code -> leverage label ("5x") dict that also holds the arrays map_leverage joins against,
+    built once per table instead of on every mapping call; treat it as read-only
+    """
+    
+    def __init__(self, labels=()):
+        super().__init__(labels)
+        self.index = pd.Index(list(self.keys()))  # pandas' string dtype, which hashes faster than object
+        self.labels = np.array(list(self.values()), dtype=object)
+        # Parse multipliers once per distinct label ("5x", "3x", ...)
+        codes, uniques = pd.factorize(self.labels)
+        unique_multipliers = pd.to_numeric(pd.Series(uniques, dtype="object").str.rstrip("x"), errors="coerce")
+        self.multipliers = unique_multipliers.to_numpy(dtype=float)[codes]
+
+
+# Append-only store of ordered results, one zlib-compressed column payload per run and screen
+RESULT_STORE_PATH = "results.db"
+RESULT_STORE_KEEP_RUNS = 200          # older runs are pruned (per screen)
+RESULT_COLUMNS = ["Stock Name", "NSE", "Leverage"]
+DEFAULT_SCREEN = "default"            # screen name of single-screen runs
+
+
+class ResultStore:
+    """SQLite snapshot store of result tables indexed by run timestamp, with a latest pointer per screen"""
+    
+    def __init__(self, path=RESULT_STORE_PATH, keep_runs=RESULT_STORE_KEEP_RUNS):
+        self.path = path
+        self.keep_runs = keep_runs
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    screen TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    payload BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_runs_screen_timestamp ON runs (screen, timestamp);
+                CREATE TABLE IF NOT EXISTS latest (
+                    screen TEXT PRIMARY KEY,
+                    run_id INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS rankings (
+                    screen TEXT PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    payload BLOB NOT NULL
+                );
+            """)
+        return self._conn
+    
+    @staticmethod
+    def encode(result_df):
+        """Column-wise JSON of the result columns, zlib-compressed"""
+        columns = {column: result_df[column].astype(str).tolist() for column in RESULT_COLUMNS}
+        return zlib.compress(json.dumps(columns, separators=(",", ":")).encode("utf-8"))
+    
+    @staticmethod
+    def decode(payload):
+        return pd.DataFrame(json.loads(zlib.decompress(payload)), columns=RESULT_COLUMNS)
+    
+    def save(self, result_df, timestamp, screen=DEFAULT_SCREEN):
+        """
+        Append one run's ordered result, point latest at it and prune past keep_runs
+        Returns: run_id
+        """
+        payload = self.encode(result_df)
+        
+        with self._lock:
+            conn = self._connect()
+            run_id = conn.execute(
+                "INSERT INTO runs (screen, timestamp, created_at, row_count, payload) VALUES (?, ?, ?, ?, ?)",
+                (screen, timestamp, time.time(), len(result_df), payload)
+            ).lastrowid
+            conn.execute("INSERT OR REPLACE INTO latest (screen, run_id) VALUES (?, ?)", (screen, run_id))
+            
+            # Keep only the newest keep_runs runs of this screen
+            conn.execute("""
+                DELETE FROM runs WHERE run_id IN (
+                    SELECT run_id FROM runs WHERE screen = ? ORDER BY run_id DESC LIMIT -1 OFFSET ?
+                )
+            """, (screen, self.keep_runs))
+            conn.commit()
+        
+        return run_id
+    
+    def load(self, run_id):
+        """
+        One stored run
+        Returns: (timestamp, screen, DataFrame) or None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT timestamp, screen, payload FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        timestamp, screen, payload = row
+        return timestamp, screen, self.decode(payload)
+    
+    def latest(self, screen=DEFAULT_SCREEN):
+        """
+        Latest run of a screen, via the latest pointer
+        Returns: (run_id, timestamp, DataFrame) or None
+        """
+        with self._lock:
+            row = self._connect().execute("""
+                SELECT runs.run_id, runs.timestamp, runs.payload FROM latest
+                JOIN runs ON runs.run_id = latest.run_id WHERE latest.screen = ?
+            """, (screen,)).fetchone()
+        if row is None:
+            return None
+        run_id, timestamp, payload = row
+        return run_id, timestamp, self.decode(payload)
+    
+    def save_ranking(self, ranking, timestamp, screen=DEFAULT_SCREEN):
+        """
+        Replace a screen's last rank list, given in rank order as (url, {"Stock Name", "NSE"} or None,
+        verified_at) - verified_at is when the row's detail page was last fetched, None if not by this store
+        """
+        entries = [[url, row["Stock Name"], row["NSE"], verified_at] if row else [url, None, None, None]
+                   for url, row, verified_at in ranking]
+        payload = zlib.compress(json.dumps(entries, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO rankings (screen, timestamp, payload) VALUES (?, ?, ?)",
+                         (screen, timestamp, payload))
+            conn.commit()
+    
+    def ranking(self, screen=DEFAULT_SCREEN):
+        """
+        The rank list saved by the screen's last stored run
+        Returns: (timestamp, [(url, {"Stock Name", "NSE"} or None, verified_at or None), ...]) or None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT timestamp, payload FROM rankings WHERE screen = ?", (screen,)
+            ).fetchone()
+        if row is None:
+            return None
+        timestamp, payload = row
+        entries = json.loads(zlib.decompress(payload))
+        return timestamp, [(url, {"Stock Name": name, "NSE": nse} if nse is not None else None,
+                            verified_at[0] if verified_at else None)
+                           for url, name, nse, *verified_at in entries]
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class StockDetailParser(HTMLParser):
+    """Collect the text of span.stock_info_heading and span.stock_exchange_details"""
+    
+    TARGET_CLASSES = ("stock_info_heading", "stock_exchange_details")
+    
+    def __init__(self):
+        super().__init__()
+        self.texts = {name: [] for name in self.TARGET_CLASSES}
+        self._current = None
+        self._span_depth = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if tag != "span":
+            return
+        if self._current:
+            self._span_depth += 1
+            return
+        classes = (dict(attrs).get("class") or "").split()
+        for name in self.TARGET_CLASSES:
+            if name in classes and not self.texts[name]:
+                self._current = name
+                self._span_depth = 1
+                break
+    
+    def handle_endtag(self, tag):
+        if tag == "span" and self._current:
+            self._span_depth -= 1
+            if self._span_depth == 0:
+                self._current = None
+    
+    def handle_data(self, data):
+        if self._current and data.strip():
+            self.texts[self._current].append(data.strip())
+    
+    def parse(self, html):
+        """
+        Parse a detail page
+        Returns: (full_name, exchange_text) - "" for anything not found
+        """
+        self.feed(html)
+        self.close()
+        full_name = " ".join(" ".join(self.texts["stock_info_heading"]).split())
+        # One line per text node, like the rendered text Selenium returns
+        exchange_text = "\n".join(self.texts["stock_exchange_details"])
+        return full_name, exchange_text
+
+
+# Histogram buckets (seconds) for stage durations in the Prometheus export
+METRIC_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+METRIC_SAMPLES = 2000                 # recent samples kept per stage for percentiles
+RUN_REPORT_PATH = "last_run_report.json"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class ScrapeMetrics:
+    """Thread-safe counters, gauges and stage duration histograms, exportable as JSON or Prometheus text"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}     # (name, ((label, value), ...)) -> count
+        self.gauges = {}       # (name, ((label, value), ...)) -> current value
+        self.stages = {}       # stage -> {"count", "sum", "buckets", "samples"}
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+    
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._observe(stage, seconds)
+    
+    def _stage(self, stage):
+        data = self.stages.get(stage)
+        if data is None:
+            data = self.stages[stage] = {"count": 0, "sum": 0.0, "buckets": [0] * len(METRIC_BUCKETS),
+                                         "samples": deque(maxlen=METRIC_SAMPLES)}
+        return data
+    
+    def _observe(self, stage, seconds):
+        data = self._stage(stage)
+        data["count"] += 1
+        data["sum"] += seconds
+        data["samples"].append(seconds)
+        for i, bound in enumerate(METRIC_BUCKETS):
+            if seconds <= bound:
+                data["buckets"][i] += 1
+    
+    @contextmanager
+    def time(self, stage):
+        """Context manager recording the wall-clock duration of its block under stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def merge(self, other):
+        """
+        Add another instance's counters and histograms into this one
+        Counts, sums and buckets are added as they are; the samples, capped at METRIC_SAMPLES, only feed percentiles
+        """
+        with other._lock:
+            counters = dict(other.counters)
+            gauges = dict(other.gauges)
+            stages = {stage: (data["count"], data["sum"], list(data["buckets"]), list(data["samples"]))
+                      for stage, data in other.stages.items()}
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for stage, (count, total, buckets, samples) in stages.items():
+                data = self._stage(stage)
+                data["count"] += count
+                data["sum"] += total
+                data["buckets"] = [mine + theirs for mine, theirs in zip(data["buckets"], buckets)]
+                data["samples"].extend(samples)
+    
+    def report(self):
+        """Stage percentiles and counters as a JSON-serialisable dict"""
+        with self._lock:
+            stages = {}
+            for stage, data in self.stages.items():
+                samples = list(data["samples"])
+                stages[stage] = {
+                    "count": data["count"],
+                    "total_s": round(data["sum"], 4),
+                    "p50_s": round(percentile(samples, 50), 4),
+                    "p95_s": round(percentile(samples, 95), 4),
+                    "max_s": round(max(samples), 4) if samples else 0.0,
+                }
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in sorted(self.gauges.items())]
+        report = {"stages": stages, "counters": counters}
+        if gauges:
+            report["gauges"] = gauges
+        return report
+    
+    def to_prometheus(self, prefix="stock_scraper"):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            if self.stages:
+                lines.append(f"# HELP {prefix}_stage_seconds Wall-clock duration of scraper stages")
+                lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, data in sorted(self.stages.items()):
+                for bound, count in zip(METRIC_BUCKETS, data["buckets"]):
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {data["count"]}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {data["sum"]:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {data["count"]}')
+            
+            typed = set()
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {prefix}_{name} {kind}")
+                        typed.add(name)
+                    label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                    lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Cumulative metrics for every run in this process (served by the bot's /metrics endpoint)
+METRICS = ScrapeMetrics()
+
+# Warm Chrome instances kept alive across scrapes
+DRIVER_POOL_SIZE = 6                  # idle drivers kept warm (2 sources + detail workers)
+DRIVER_MAX_USES = 50                  # recycle a driver after this many checkouts
+DRIVER_MAX_MEMORY_MB = 800            # recycle when the Chrome process tree grows past this
+DRIVER_MAX_HANDLES = 4                # more open tabs than this at check-in means something leaked: recycle
+DRIVER_MAX_AGE = 6 * 3600             # recycle long-lived browsers however well they look
+DRIVER_IDLE_TIMEOUT = 10 * 60         # quit drivers left idle this long (the bot idles between scrapes)
+DRIVER_REAP_INTERVAL = 60             # seconds between background trims of the idle drivers
+
+# chromedriver binary to use as is; unset, webdriver_manager downloads one (which needs the network)
+CHROMEDRIVER_PATH = os.environ.get("CHROMEDRIVER")
+
+_chromedriver_path = None
+_chromedriver_resolved = False
+_chromedriver_lock = threading.Lock()
+
+
+def resolve_chromedriver():
+    """
+    Resolve the chromedriver binary once per process instead of on every driver start
+    Returns: its path, or None to let Selenium find one (Selenium Manager or PATH) when
+    webdriver_manager cannot, e.g. offline
+    """
+    global _chromedriver_path, _chromedriver_resolved
+    with _chromedriver_lock:
+        if not _chromedriver_resolved:
+            if CHROMEDRIVER_PATH:
+                _chromedriver_path = CHROMEDRIVER_PATH
+            else:
+                try:
+                    _chromedriver_path = webdriver_manager.ChromeDriverManager().install()
+                except Exception as e:
+                    logging.warning(f"webdriver_manager could not resolve chromedriver, "
+                                    f"leaving it to Selenium: {str(e)}")
+                    _chromedriver_path = None
+            _chromedriver_resolved = True
+            logging.info(f"Resolved chromedriver: {_chromedriver_path or 'Selenium Manager / PATH'}")
+        return _chromedriver_path
+
+
+def build_chrome_driver(headless=True):
+    """Start a Selenium Chrome driver with the scraper's options"""
+    options = chrome_options.Options()
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+    options.add_argument(f"user-agent={USER_AGENT}")
+    
+    return webdriver.Chrome(service=chrome_service.Service(resolve_chromedriver()), options=options)
+
+
+def driver_memory_mb(driver):
+    """Resident memory of the chromedriver process and all its Chrome children, in MB (None if unknown)"""
+    if psutil is None:
+        return None
+    try:
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class DriverPool:
+    """
+    Keeps warmed headless Chrome drivers alive across scrapes and recycles worn-out ones
+    Each session's age, checkouts, open handles and memory are tracked; a background reaper
+    quits drivers that sit idle too long so a long-running worker's footprint stays flat
+    """
+    
+    def __init__(self, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES, max_memory_mb=DRIVER_MAX_MEMORY_MB,
+                 headless=True, max_handles=DRIVER_MAX_HANDLES, max_age=DRIVER_MAX_AGE,
+                 idle_timeout=DRIVER_IDLE_TIMEOUT):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.max_handles = max_handles
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.headless = headless
+        self._idle = []
+        self._sessions = {}    # id(driver) -> {"started_at", "uses", "idle_since", "handles", "memory_mb"}
+        self._started = 0
+        self._recycled = {}    # reason -> count
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper = None
+    
+    def _start(self):
+        """Launch a new driver and start tracking its session"""
+        driver = build_chrome_driver(headless=self.headless)
+        with self._lock:
+            self._sessions[id(driver)] = {"started_at": time.time(), "uses": 0, "idle_since": None,
+                                          "handles": 1, "memory_mb": None}
+            self._started += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="driver-reaper", daemon=True)
+                self._reaper.start()
+        METRICS.inc("driver_starts_total")
+        return driver
+    
+    def warm(self, count=1):
+        """Resolve the driver binary and pre-start up to count idle drivers"""
+        resolve_chromedriver()
+        with self._lock:
+            missing = max(0, min(count, self.size) - len(self._idle))
+        for _ in range(missing):
+            driver = self._start()
+            with self._lock:
+                self._sessions[id(driver)]["idle_since"] = time.time()
+                self._idle.append(driver)
+        logging.info(f"Driver pool warmed: {len(self._idle)} idle")
+    
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+    
+    def _discard(self, driver, reason=None):
+        with self._lock:
+            self._sessions.pop(id(driver), None)
+            if reason:
+                self._recycled[reason] = self._recycled.get(reason, 0) + 1
+        if reason:
+            METRICS.inc("driver_recycles_total", reason=reason)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    
+    def acquire(self):
+        """Check out a healthy driver, starting a new one if none is idle"""
+        while True:
+            with self._lock:
+                driver = self._idle.pop() if self._idle else None
+            if driver is None:
+                break
+            if self._is_healthy(driver):
+                with self._lock:
+                    self._sessions[id(driver)]["idle_since"] = None
+                return driver
+            logging.warning("Discarding unhealthy pooled driver")
+            self._discard(driver, "unhealthy")
+        
+        return self._start()
+    
+    def _reset_tabs(self, driver):
+        """
+        Close every tab but the first and blank it, whatever state the last user left it in
+        Returns: number of handles that were open
+        """
+        handles = list(driver.window_handles)
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+        return len(handles)
+    
+    def _recycle_reason(self, driver, session):
+        """Why a checked-in driver should be quit rather than pooled (None to keep it)"""
+        if session["uses"] >= self.max_uses:
+            return "uses", f"{session['uses']} uses"
+        if time.time() - session["started_at"] >= self.max_age:
+            return "age", f"{(time.time() - session['started_at']) / 3600:.1f} h old"
+        if not self._is_healthy(driver):
+            return "unhealthy", "unhealthy"
+        
+        try:
+            session["handles"] = self._reset_tabs(driver)
+        except Exception:
+            return "reset_failed", "reset failed"
+        if session["handles"] > self.max_handles:
+            return "handles", f"{session['handles']} handles open"
+        
+        session["memory_mb"] = driver_memory_mb(driver)
+        if session["memory_mb"] is not None and session["memory_mb"] > self.max_memory_mb:
+            return "memory", f"{session['memory_mb']:.0f} MB"
+        return None
+    
+    def release(self, driver):
+        """Return a driver to the pool with a single blank tab, or quit it if it is worn out, broken or surplus"""
+        with self._lock:
+            session = self._sessions.get(id(driver))
+            if session is None:
+                session = self._sessions[id(driver)] = {"started_at": time.time(), "uses": 0, "idle_since": None,
+                                                        "handles": 1, "memory_mb": None}
+            session["uses"] += 1
+        
+        recycle = self._recycle_reason(driver, session)
+        
+        with self._lock:
+            if recycle is None and len(self._idle) < self.size and not self._closed.is_set():
+                session["idle_since"] = time.time()
+                self._idle.append(driver)
+                return
+        
+        if recycle:
+            reason, detail = recycle
+            logging.info(f"Recycling pooled driver ({detail})")
+        else:
+            reason = "surplus"
+        self._discard(driver, reason)
+    
+    def trim(self):
+        """Quit idle drivers that have been idle past idle_timeout or grown past max_age"""
+        now = time.time()
+        with self._lock:
+            expired = []
+            for driver in self._idle:
+                session = self._sessions.get(id(driver), {})
+                if now - (session.get("idle_since") or now) >= self.idle_timeout:
+                    expired.append((driver, "idle"))
+                elif now - session.get("started_at", now) >= self.max_age:
+                    expired.append((driver, "age"))
+            for driver, _ in expired:
+                self._idle.remove(driver)
+        
+        for driver, reason in expired:
+            self._discard(driver, reason)
+        if expired:
+            logging.info(f"Driver pool trimmed {len(expired)} idle drivers, {len(self._idle)} left")
+        return len(expired)
+    
+    def _reap_loop(self):
+        while not self._closed.wait(DRIVER_REAP_INTERVAL):
+            try:
+                self.trim()
+            except Exception as e:
+                logging.warning(f"Driver pool trim failed: {str(e)}")
+    
+    def stats(self):
+        """Pool size, session counters and last known memory per live driver"""
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "in_use": len(self._sessions) - len(self._idle),
+                "started_total": self._started,
+                "recycled": dict(self._recycled),
+                "memory_mb": [round(session["memory_mb"]) for session in self._sessions.values()
+                              if session["memory_mb"] is not None],
+                "max_handles_seen": max((session["handles"] for session in self._sessions.values()), default=0),
+            }
+    
+    def close_all(self):
+        """Stop the reaper and quit every idle driver"""
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+
+# Shared by every scraper in this process
+DRIVER_POOL = DriverPool()
+atexit.register(DRIVER_POOL.close_all)
+
+
+# Bulk row extraction: one execute_script call returns every row's values instead
+# of one WebDriver round-trip per element and attribute
+ZERODHA_ROWS_JS = """
+return Array.from(document.querySelectorAll("tr[data-scrip]"), function (row) {
+    return [row.getAttribute("data-scrip"), row.getAttribute("data-mis_multiplier")];
+});
+"""
+
+TRENDLYNE_LINKS_JS = """
+var rows = document.evaluate("//tbody/tr", document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var links = [];
+for (var i = 0; i < rows.snapshotLength; i++) {
+    var link = rows.snapshotItem(i).querySelector("a[href*='/equity/']");
+    links.push(link ? link.href : null);
+}
+return links;
+"""
+
+
+def screen_name(url):
+    """Short tag for a screen URL, e.g. .../top-gainers/3-month/index/NIFTY500/nifty-500/ -> 3-month-nifty-500"""
+    parts = [part for part in urlparse(url).path.split("/") if part]
+    if len(parts) >= 4:
+        parts = [parts[-4], parts[-1]]
+    return re.sub(r"[^A-Za-z0-9-]+", "-", "-".join(parts)) or "screen"
+
+
+def resolve_screens(spec=""):
+    """
+    Parse a comma-separated list of TRENDLYNE_SCREENS names and/or screen URLs
+    An empty spec selects every screen in TRENDLYNE_SCREENS
+    Returns: dict of name -> URL in the given order
+    """
+    screens = {}
+    for item in (part.strip() for part in spec.split(",")):
+        if not item:
+            continue
+        if item in TRENDLYNE_SCREENS:
+            screens[item] = TRENDLYNE_SCREENS[item]
+        elif item.startswith(("http://", "https://")):
+            screens[screen_name(item)] = item
+        else:
+            raise ValueError(f"Unknown screen '{item}' (known: {', '.join(TRENDLYNE_SCREENS)})")
+    return screens or dict(TRENDLYNE_SCREENS)
+
+
 class CombinedStockScraper:
     """Main class to scrape Trendlyne Top Gainers and map with Zerodha 5x leverage"""
     
-    def __init__(self):
-        self.trendlyne_url = "https://trendlyne.com/stock-screeners/price-based/top-gainers/3-month/index/NIFTY500/nifty-500/"
-        self.zerodha_url = "https://zerodha.com/margin-calculator/Equity/"
-        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.output_excel = f"Trendlyne_TopGainers_5x_Leverage_{self.timestamp}.xlsx"
-        self.output_csv = f"Trendlyne_TopGainers_5x_Leverage_{self.timestamp}.csv"
+    def __init__(self, concurrent=False, detail_workers=DETAIL_WORKERS, detail_engine=DETAIL_ENGINE,
+                 symbol_cache=None, wait_timeouts=None, driver_pool=None, leverage_index=None,
+                 trendlyne_url=TRENDLYNE_URL, zerodha_url=ZERODHA_URL, min_leverage=MIN_LEVERAGE,
+                 result_store=None, retries=FETCH_RETRIES, breaker_settings=None, incremental=False):
+        self.trendlyne_url = trendlyne_url
+        self.zerodha_url = zerodha_url
+        self.set_output_paths()
+        
+        self.min_leverage = min_leverage
         
+        # Run Zerodha and Trendlyne in parallel instead of one after the other
+        self.concurrent = concurrent
+        # Set when one source fails so the other can stop early
+        self.abort_event = threading.Event()
+        # Wall-clock seconds per stage, filled in by _timed_stage
+        self.stage_timings = {}
+        # Per-run counters and stage histograms; merged into METRICS when a run ends
+        self.metrics = ScrapeMetrics()
+        self.last_report = None
+        # Called with ("leverage", data), ("links", count) and ("row", rank, row) while a scrape runs
+        self.progress_listener = None
+        # Ordered result DataFrame of the last scrape_stream() run (None if it failed)
+        self.last_result = None
+        # Number of Chrome instances resolving /equity/ detail pages in parallel
+        self.detail_workers = detail_workers
+        self.detail_engine = detail_engine
+        self._http_session = None
+        # Known symbols are served from here instead of re-visiting their detail page
+        self.symbol_cache = symbol_cache if symbol_cache is not None else SymbolCache()
+        # Zerodha multipliers are reused from here while the latest version is fresh
+        self.leverage_index = leverage_index if leverage_index is not None else LeverageIndex()
+        # Ordered results of every run are appended here; Excel/CSV are exported from it on demand
+        self.result_store = result_store if result_store is not None else ResultStore()
+        # screen -> run_id of the snapshots saved by the current run
+        self.run_ids = {}
+        # Incremental mode: stocks the screen's last stored run listed keep that run's details,
+        # so only newcomers' detail pages are fetched
+        self.incremental = incremental
+        # screen -> [(url, row or None, verified_at)] of the current run, stored with its snapshot
+        self.rankings = {}
+        # url -> when this run fetched its detail page (rows carried over expire SYMBOL_CACHE_TTL after it)
+        self.verified_at = {}
+        # {"version", "age_s", "reason"} of the leverage index version used instead of the Zerodha scrape, else None
+        self.leverage_fallback = None
+        # screen -> entries/exits/moves against the screen's last stored run
+        self.rank_deltas = {}
+        # Per-stage wait budgets, overridable per instance
+        self.wait_timeouts = dict(WAIT_TIMEOUTS, **(wait_timeouts or {}))
+        # Attempts per page fetch, and one breaker per host (created on first use)
+        self.retries = max(1, retries)
+        self.breaker_settings = dict(BREAKER_SETTINGS, **(breaker_settings or {}))
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        # Warm Chrome instances shared across scrapes in this process
+        self.driver_pool = driver_pool or DRIVER_POOL
+        
+    def _notify(self, event, *payload):
+        """Forward a progress event to the listener, if one is attached"""
+        listener = self.progress_listener
+        if listener is not None:
+            listener(event, *payload)
+    
+    def breaker_for(self, url):
+        """The circuit breaker of url's host"""
+        host = urlparse(url).netloc
+        with self._breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = HostBreaker(host, **self.breaker_settings)
+            return self.breakers[host]
+    
+    def fetch_with_retry(self, url, fetch, stage):
+        """
+        Call fetch() through the host breaker of url, retrying failures with jittered exponential backoff
+        Returns: fetch()'s result; raises the last error once attempts run out (CircuitOpenError at once)
+        """
+        breaker = self.breaker_for(url)
+        for attempt in range(self.retries):
+            try:
+                with breaker.call():
+                    return fetch()
+            except CircuitOpenError:
+                self.metrics.inc("circuit_rejections_total", stage=stage)
+                raise
+            except Exception as e:
+                if attempt + 1 >= self.retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                self.metrics.inc("fetch_retries_total", stage=stage)
+                logging.debug(f"Retrying {url} in {delay:.2f}s after: {str(e)}")
+                # Stop retrying as soon as the run is aborted
+                if self.abort_event.wait(delay):
+                    raise
+    
+    def _acquire_driver(self):
+        """Check a driver out of the pool, timing the startup when none is warm"""
+        with self.metrics.time("driver_acquire"):
+            return self.driver_pool.acquire()
+    
+    def set_output_paths(self):
+        """Timestamp the output file names for a new run"""
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_excel, self.output_csv = self.output_paths()
+    
+    def output_paths(self, screen=DEFAULT_SCREEN, timestamp=None):
+        """Excel and CSV export paths for a screen's run (defaults to the current run)"""
+        tag = "" if screen == DEFAULT_SCREEN else f"_{screen}"
+        base = f"Trendlyne_TopGainers{tag}_5x_Leverage_{timestamp or self.timestamp}"
+        return f"{base}.xlsx", f"{base}.csv"
+    
     def setup_driver(self, headless=True):
         """Setup Selenium Chrome driver with options"""
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-        
-        return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+        return build_chrome_driver(headless=headless)
+
+    # ============================================================================
+    # WAITS - Poll for readiness instead of sleeping for fixed times
+    # ============================================================================
+    
+    def wait_until(self, stage, condition, required=False):
+        """
+        Poll condition() until it returns a truthy value or the stage budget runs out
+        Stops early if the run is aborted
+        Returns: the truthy value, or None on timeout (raises TimeoutException if required)
+        """
+        timeout = self.wait_timeouts[stage]
+        wait_start = time.time()
+        
+        while True:
+            try:
+                value = condition()
+            except Exception:
+                value = None
+            
+            elapsed = time.time() - wait_start
+            if value:
+                logging.info(f"⏱ Wait '{stage}' met in {elapsed:.2f}s (budget {timeout}s)")
+                return value
+            if self.abort_event.is_set():
+                return None
+            if elapsed >= timeout:
+                logging.warning(f"⏱ Wait '{stage}' timed out after {elapsed:.2f}s")
+                self.metrics.inc("wait_timeouts_total", wait=stage)
+                if required:
+                    raise TimeoutException(f"Wait '{stage}' timed out after {timeout}s")
+                return None
+            
+            time.sleep(WAIT_POLL_INTERVAL)
+    
+    def wait_for_stable_row_count(self, driver, stage, css_selector):
+        """
+        Keep scrolling to the bottom until the number of rows matching css_selector
+        stops growing for WAIT_STABLE_POLLS polls
+        Returns: last observed row count
+        """
+        state = {"count": -1, "stable_polls": 0}
+        
+        def rows_settled():
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            count = driver.execute_script("return document.querySelectorAll(arguments[0]).length;", css_selector)
+            if count and count == state["count"]:
+                state["stable_polls"] += 1
+            else:
+                state["count"], state["stable_polls"] = count, 0
+            return count if state["stable_polls"] >= WAIT_STABLE_POLLS else None
+        
+        with self.metrics.time("scrolling"):
+            count = self.wait_until(stage, rows_settled)
+        return count if count is not None else max(state["count"], 0)
+
+    # ============================================================================
+    # ROW EXTRACTION - Bulk via one execute_script, per-element as fallback
+    # ============================================================================
+    
+    def extract_zerodha_multipliers(self, driver):
+        """
+        Read data-scrip / data-mis_multiplier from every tr[data-scrip] in one script call
+        Returns: (row count, dict of NSE code -> raw multiplier)
+        """
+        try:
+            pairs = driver.execute_script(ZERODHA_ROWS_JS)
+        except Exception as e:
+            logging.warning(f"Bulk Zerodha extraction failed, reading rows one by one: {str(e)}")
+            return self.extract_zerodha_multipliers_per_element(driver)
+        
+        multipliers = {}
+        for scrip, leverage in pairs:
+            if scrip:
+                multipliers[scrip.strip().upper()] = (leverage or "0").strip()
+        return len(pairs), multipliers
+    
+    def extract_zerodha_multipliers_per_element(self, driver):
+        """Same as extract_zerodha_multipliers with one WebDriver call per attribute"""
+        rows = driver.find_elements(selenium_by.By.CSS_SELECTOR, "tr[data-scrip]")
+        multipliers = {}
+        
+        for row in rows:
+            try:
+                scrip = row.get_attribute("data-scrip")
+                leverage = row.get_attribute("data-mis_multiplier") or "0"
+                
+                if scrip:
+                    multipliers[scrip.strip().upper()] = leverage.strip()
+            except Exception:
+                continue
+        
+        return len(rows), multipliers
+    
+    def extract_trendlyne_links(self, driver):
+        """
+        Collect the first /equity/ link of every //tbody/tr row in one script call
+        Returns: (row count, list of absolute stock URLs in table order)
+        """
+        try:
+            hrefs = driver.execute_script(TRENDLYNE_LINKS_JS)
+        except Exception as e:
+            logging.warning(f"Bulk Trendlyne extraction failed, reading rows one by one: {str(e)}")
+            return self.extract_trendlyne_links_per_element(driver)
+        
+        return len(hrefs), [href for href in hrefs if href]
+    
+    def extract_trendlyne_links_per_element(self, driver):
+        """Same as extract_trendlyne_links with WebDriver calls per row"""
+        stock_rows = driver.find_elements(selenium_by.By.XPATH, "//tbody/tr")
+        stock_links = []
+        
+        for row in stock_rows:
+            try:
+                link = row.find_element(selenium_by.By.XPATH, ".//a[contains(@href, '/equity/')]")
+                href = link.get_attribute("href")
+                if href:
+                    stock_links.append(href)
+            except:
+                pass
+        
+        return len(stock_rows), stock_links
 
     # ============================================================================
     # ZERODHA SCRAPING - Get all stocks with 5x leverage
@@ -66,67 +1318,143 @@ class CombinedStockScraper:
     
     def scrape_zerodha_leverage(self):
         """
-        Scrape Zerodha Margin Calculator for stocks with 5x leverage
-        Returns: set of NSE codes with 5x leverage
+        Get Zerodha leverage for all stocks, from the leverage index while it is
+        fresh, otherwise by scraping the Margin Calculator and saving a new index version
+        Returns: LeverageTable of NSE code -> leverage like "5x" (empty on failure)
         """
         logging.info("="*80)
         logging.info("[Task 1] Scraping Zerodha Margin Calculator...")
         logging.info("="*80)
         
-        driver = self.setup_driver(headless=True)
-        zerodha_5x_set = set()
-        all_leverage_data = {}
+        if self.leverage_index:
+            try:
+                latest = self.leverage_index.latest(max_age=self.leverage_index.ttl)
+            except sqlite3.Error as e:
+                logging.warning(f"Leverage index unavailable: {str(e)}")
+                latest = None
+            
+            if latest:
+                version, created_at, multipliers = latest
+                logging.info(f"✓ Using leverage index version {version} "
+                             f"({(time.time() - created_at) / 60:.0f} min old), skipping Zerodha scrape")
+                return self.leverage_table(multipliers)
+        
+        multipliers = self.scrape_zerodha_multipliers()
+        
+        if not multipliers and self.leverage_index:
+            # Better a recent margin table than aborting the run
+            fallback = self._leverage_fallback("scrape_failed")
+            if fallback is not None:
+                return self.leverage_table(fallback)
+        
+        if multipliers and self.leverage_index:
+            try:
+                version, diff = self.leverage_index.save(multipliers)
+                if version is None:
+                    # Most scrips vanishing at once means the table was read before it finished loading
+                    self.metrics.inc("leverage_index_rejected_total")
+                    logging.warning(f"Not saving the Zerodha table: {len(diff['removed'])} scrips of the previous "
+                                    f"version are missing ({len(multipliers)} read)")
+                    fallback = self._leverage_fallback("incomplete")
+                    if fallback is not None:
+                        return self.leverage_table(fallback)
+                else:
+                    logging.info(f"✓ Saved leverage index version {version}: "
+                                 f"{len(diff['added'])} added, {len(diff['removed'])} removed, "
+                                 f"{len(diff['changed'])} changed")
+                    for scrip, (old, new) in list(diff["changed"].items())[:10]:
+                        logging.info(f"  • {scrip}: {old}x -> {new}x")
+            except sqlite3.Error as e:
+                logging.warning(f"Could not save leverage index: {str(e)}")
+        
+        all_leverage_data = self.leverage_table(multipliers)
+        logging.info(f"✓ Extracted {len(all_leverage_data)} stocks from Zerodha")
+        logging.info(f"✓ Stocks with >={self.min_leverage}x leverage: "
+                     f"{int((all_leverage_data.multipliers >= self.min_leverage).sum())}")
+        
+        return all_leverage_data
+    
+    @staticmethod
+    def leverage_table(multipliers):
+        """
+        Turn raw data-mis_multiplier values into the lookup table used for mapping
+        Returns: LeverageTable of NSE code -> leverage like "5x"
+        """
+        return LeverageTable({scrip: leverage + "x" if leverage.isdigit() else leverage
+                              for scrip, leverage in multipliers.items()})
+    
+    def _leverage_fallback(self, reason):
+        """
+        The latest leverage index version, in place of a failed ("scrape_failed") or suspect ("incomplete")
+        Zerodha scrape, recorded in self.leverage_fallback
+        Returns: {scrip: multiplier}, or None if there is none younger than LEVERAGE_FALLBACK_MAX_AGE
+        """
+        cause = "Zerodha scrape failed" if reason == "scrape_failed" else "Zerodha table looked incomplete"
+        try:
+            latest = self.leverage_index.latest()
+        except sqlite3.Error as e:
+            logging.warning(f"Leverage index unavailable: {str(e)}")
+            return None
+        if not latest:
+            return None
+        
+        version, created_at, multipliers = latest
+        age = time.time() - created_at
+        if age >= LEVERAGE_FALLBACK_MAX_AGE:
+            self.metrics.inc("leverage_index_fallbacks_total", result="too_old", reason=reason)
+            logging.error(f"{cause} and leverage index version {version} is "
+                          f"{age / 3600:.1f} h old (limit {LEVERAGE_FALLBACK_MAX_AGE / 3600:.0f} h)")
+            return None
+        self.metrics.inc("leverage_index_fallbacks_total", result="used", reason=reason)
+        self.leverage_fallback = {"version": version, "age_s": round(age), "reason": reason}
+        logging.warning(f"{cause}, falling back to leverage index version {version} ({age / 3600:.1f} h old)")
+        return multipliers
+    
+    def scrape_zerodha_multipliers(self):
+        """
+        Scrape the Zerodha Margin Calculator
+        Returns: dict of NSE code -> raw data-mis_multiplier, empty on failure
+        """
+        driver = self._acquire_driver()
+        multipliers = {}
         
         try:
-            logging.info(f"Navigating to: {self.zerodha_url}")
-            driver.get(self.zerodha_url)
+            def load_table():
+                logging.info(f"Navigating to: {self.zerodha_url}")
+                with self.metrics.time("page_load"):
+                    driver.get(self.zerodha_url)
+                
+                # Wait for table to load
+                logging.info("Waiting for table to load...")
+                self.wait_until(
+                    "zerodha_table",
+                    lambda: driver.find_elements(selenium_by.By.CSS_SELECTOR, "tr[data-scrip]"),
+                    required=True
+                )
             
-            # Wait for table to load
-            logging.info("Waiting for table to load...")
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "tr[data-scrip]"))
-            )
-            time.sleep(5)
+            # A timed-out table wait reloads the page instead of failing the run
+            self.fetch_with_retry(self.zerodha_url, load_table, "zerodha")
             
-            # Scroll down to load all entries
+            # Scroll down until no more entries load
             logging.info("Loading all stocks...")
-            for i in range(20):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(0.5)
+            self.wait_for_stable_row_count(driver, "zerodha_rows", "tr[data-scrip]")
+            if self.abort_event.is_set():
+                logging.warning("Zerodha scrape aborted")
+                return {}
             
             # Extract all rows
-            rows = driver.find_elements(By.CSS_SELECTOR, "tr[data-scrip]")
-            logging.info(f"Found {len(rows)} stocks in Zerodha")
-            
-            for row in rows:
-                try:
-                    scrip = row.get_attribute("data-scrip")
-                    leverage = row.get_attribute("data-mis_multiplier") or "0"
-                    
-                    if scrip:
-                        scrip = scrip.strip().upper()
-                        leverage = leverage.strip()
-                        
-                        # Store all leverage data
-                        all_leverage_data[scrip] = leverage + "x" if leverage.isdigit() else leverage
-                        
-                        # Collect 5x leverage stocks
-                        if leverage == "5":
-                            zerodha_5x_set.add(scrip)
-                except Exception as e:
-                    continue
-            
-            logging.info(f"✓ Extracted {len(all_leverage_data)} stocks from Zerodha")
-            logging.info(f"✓ Stocks with 5x leverage: {len(zerodha_5x_set)}")
+            with self.metrics.time("row_extraction"):
+                row_count, multipliers = self.extract_zerodha_multipliers(driver)
+            logging.info(f"Found {row_count} stocks in Zerodha")
             
-            return zerodha_5x_set, all_leverage_data
+            return multipliers
             
         except Exception as e:
             logging.error(f"Error scraping Zerodha: {str(e)}")
-            return set(), {}
+            return {}
         
         finally:
-            driver.quit()
+            self.driver_pool.release(driver)
 
     # ============================================================================
     # TRENDLYNE SCRAPING - Get top 100 gainers with full names and NSE
@@ -142,164 +1470,515 @@ class CombinedStockScraper:
         logging.info("[Task 2] Scraping Trendlyne Top 100 Gainers (3-Month)...")
         logging.info("="*80)
         
-        driver = self.setup_driver(headless=True)
-        trendlyne_data = []
+        stock_links = self.collect_trendlyne_links(self.trendlyne_url)
+        if not stock_links:
+            return pd.DataFrame(columns=["Stock Name", "NSE"])
+        self._notify("links", len(stock_links))
+        
+        try:
+            # Fan the links out to the detail worker pool (results come back in rank order)
+            previous = self.previous_ranking(DEFAULT_SCREEN)
+            known = self._known_details([previous])
+            details = self.resolve_stock_details(stock_links, known)
+            self._record_ranking(DEFAULT_SCREEN, stock_links, details, previous, known)
+            trendlyne_data = [row for row in details if row]
+        except Exception as e:
+            logging.error(f"Error scraping Trendlyne: {str(e)}")
+            return pd.DataFrame(columns=["Stock Name", "NSE"])
+        
+        if self.abort_event.is_set():
+            logging.warning("Trendlyne scrape aborted")
+            return pd.DataFrame(columns=["Stock Name", "NSE"])
+        
+        logging.info(f"\n✓ Successfully extracted {len(trendlyne_data)} top gainers from Trendlyne")
+        return pd.DataFrame(trendlyne_data)
+    
+    def collect_trendlyne_links(self, trendlyne_url):
+        """
+        Load one Trendlyne screen with all 100 entries shown and read its /equity/ links
+        The driver goes back to the pool before any detail page is fetched
+        Returns: list of up to 100 stock URLs in rank order ([] on failure)
+        """
+        driver = self._acquire_driver()
         
         try:
-            logging.info(f"Navigating to: {self.trendlyne_url}")
-            driver.get(self.trendlyne_url)
+            def load_page():
+                logging.info(f"Navigating to: {trendlyne_url}")
+                with self.metrics.time("page_load"):
+                    driver.get(trendlyne_url)
+                
+                # Wait for page to load: the entries dropdown or the first table rows
+                logging.info("Waiting for page to load...")
+                self.wait_until(
+                    "trendlyne_page",
+                    lambda: driver.find_elements(selenium_by.By.XPATH, "//option[@value='100'] | //tbody/tr"),
+                    required=True
+                )
             
-            # Wait for page to load
-            logging.info("Waiting for page to load...")
-            time.sleep(8)
+            self.fetch_with_retry(trendlyne_url, load_page, "trendlyne")
             
             # Find and click dropdown to show 100 entries
             logging.info("Selecting 100 entries from dropdown...")
             try:
-                # Wait for dropdown option
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located((By.XPATH, "//option[@value='100']"))
-                )
+                rows_before = len(driver.find_elements(selenium_by.By.XPATH, "//tbody/tr"))
                 
                 # Click the option to show 100
-                option_100 = driver.find_element(By.XPATH, "//option[@value='100']")
+                option_100 = driver.find_element(selenium_by.By.XPATH, "//option[@value='100']")
                 option_100.click()
                 logging.info("✓ Selected 100 entries")
-                time.sleep(5)
+                
+                # Wait for the table to redraw with more rows
+                self.wait_until(
+                    "trendlyne_expand",
+                    lambda: len(driver.find_elements(selenium_by.By.XPATH, "//tbody/tr")) != rows_before
+                )
             except Exception as e:
                 logging.warning(f"Could not find 100 option dropdown: {str(e)}")
                 logging.info("Attempting alternative method...")
             
-            # Scroll aggressively to load all 100 entries
+            # Scroll until no more of the 100 entries load
             logging.info("Loading all 100 top gainers...")
-            for scroll_count in range(30):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(0.8)
+            self.wait_for_stable_row_count(driver, "trendlyne_rows", "tbody > tr")
             
-            # Find all stock rows
-            stock_rows = driver.find_elements(By.XPATH, "//tbody/tr")
-            logging.info(f"Found {len(stock_rows)} rows in the table")
+            # Extract stock links from all rows
+            with self.metrics.time("row_extraction"):
+                row_count, stock_links = self.extract_trendlyne_links(driver)
+            logging.info(f"Found {row_count} rows in the table")
+            logging.info(f"Extracted {len(stock_links)} stock links")
+            return stock_links[:100]
             
-            # Extract stock links from rows
-            stock_links = []
-            for row in stock_rows:
-                try:
-                    link = row.find_element(By.XPATH, ".//a[contains(@href, '/equity/')]")
-                    href = link.get_attribute("href")
-                    if href:
-                        stock_links.append(href)
-                except:
-                    pass
+        except Exception as e:
+            logging.error(f"Error scraping Trendlyne: {str(e)}")
+            return []
+        
+        finally:
+            self.driver_pool.release(driver)
+
+    # ============================================================================
+    # STOCK DETAIL WORKERS - Resolve full name and NSE code per stock page
+    # ============================================================================
+    
+    @staticmethod
+    def parse_nse_code(nse_text):
+        """Parse NSE code from text like "NSE: SYMBOLCODE | BSE: 123456 | ASM" """
+        for line in nse_text.split("\n"):
+            if "NSE:" in line:
+                # Extract just the symbol after "NSE:"
+                nse_part = line.split("NSE:")[1].strip()
+                # Take only the first part before any pipe or special character
+                return nse_part.split("|")[0].strip()
+        return "N/A"
+    
+    def extract_stock_detail(self, driver, stock_url):
+        """
+        Load a Trendlyne /equity/ page in the given driver
+        Returns: (full_name, nse_code) - "N/A" for anything not found
+        """
+        driver.get(stock_url)
+        try:
+            selenium_ui.WebDriverWait(driver, self.wait_timeouts["detail_page"], poll_frequency=WAIT_POLL_INTERVAL).until(
+                EC.presence_of_element_located((selenium_by.By.CSS_SELECTOR, "span.stock_info_heading"))
+            )
+        except:
+            pass
+        
+        # Extract full stock name from stock_info_heading
+        full_name = "N/A"
+        try:
+            full_name = driver.find_element(selenium_by.By.CSS_SELECTOR, "span.stock_info_heading").text.strip()
+        except:
+            try:
+                full_name = driver.find_element(selenium_by.By.TAG_NAME, "h1").text.strip()
+            except:
+                pass
+        
+        # Extract NSE code from stock_exchange_details
+        nse_code = "N/A"
+        try:
+            stock_exchange_div = driver.find_element(selenium_by.By.CSS_SELECTOR, "span.stock_exchange_details")
+            nse_code = self.parse_nse_code(stock_exchange_div.text)
+        except:
+            pass
+        
+        return full_name, nse_code
+    
+    def get_http_session(self):
+        """Shared keep-alive session sized for the HTTP detail workers"""
+        if self._http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_DETAIL_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            self._http_session = session
+        return self._http_session
+    
+    def fetch_stock_detail_http(self, stock_url):
+        """
+        Fetch a Trendlyne /equity/ page over plain HTTP and parse it without a browser
+        Returns: (full_name, nse_code) - "N/A" for anything not found
+        """
+        response = self.get_http_session().get(stock_url, timeout=15)
+        response.raise_for_status()
+        
+        full_name, exchange_text = StockDetailParser().parse(response.text)
+        nse_code = self.parse_nse_code(exchange_text) if exchange_text else "N/A"
+        return full_name or "N/A", nse_code or "N/A"
+    
+    def _fetch_details_http(self, jobs, results):
+        """
+        Resolve (idx, url) jobs with the HTTP fast path
+        Returns: (jobs whose page could not be parsed - or was refused with a 403 - and need Selenium,
+                  jobs that failed to fetch and are left for the re-queue pass)
+        Jobs rejected by an open circuit or answered with a lasting client error (e.g. 404) are in
+        neither: they are given up for the run
+        """
+        def fetch(job):
+            idx, stock_url = job
+            try:
+                with self.metrics.time("detail_page_http"):
+                    full_name, nse_code = self.fetch_with_retry(
+                        stock_url, lambda: self.fetch_stock_detail_http(stock_url), "detail_page_http"
+                    )
+            except CircuitOpenError:
+                self.metrics.inc("detail_pages_total", engine="http", result="rejected")
+                return "rejected", job
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 403:
+                    # Blocked for not being a browser: a page Selenium may still read
+                    self.metrics.inc("detail_pages_total", engine="http", result="blocked")
+                    return "unparsed", job
+                logging.debug(f"  [{idx:3}] HTTP fetch failed: {str(e)}")
+                self.metrics.inc("detail_pages_total", engine="http", result="error")
+                return "failed" if is_retryable(e) else "given_up", job
+            except Exception as e:
+                logging.debug(f"  [{idx:3}] HTTP fetch failed: {str(e)}")
+                self.metrics.inc("detail_pages_total", engine="http", result="error")
+                return "failed", job
             
-            logging.info(f"Extracted {len(stock_links)} stock links")
-            logging.info("Processing each stock to extract full name and NSE code...\n")
+            if full_name == "N/A" or nse_code == "N/A":
+                self.metrics.inc("detail_pages_total", engine="http", result="unparsed")
+                return "unparsed", job
+            
+            self.metrics.inc("detail_pages_total", engine="http", result="ok")
+            self._store_detail(results, idx, full_name, nse_code)
+            logging.info(f"  [{idx:3}] {full_name:<50} | NSE: {nse_code}")
+            return None
+        
+        num_workers = max(1, min(HTTP_DETAIL_WORKERS, len(jobs)))
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="http-detail") as executor:
+            outcomes = [outcome for outcome in executor.map(fetch, jobs) if outcome]
+        
+        unparsed = [job for kind, job in outcomes if kind == "unparsed"]
+        failed = [job for kind, job in outcomes if kind == "failed"]
+        rejected = sum(kind == "rejected" for kind, _ in outcomes)
+        given_up = sum(kind == "given_up" for kind, _ in outcomes)
+        if rejected:
+            logging.warning(f"{rejected} stocks rejected by an open circuit, not retried this run")
+        if given_up:
+            logging.warning(f"{given_up} stocks answered with a client error, not retried this run")
+        return unparsed, failed
+    
+    def _store_detail(self, results, idx, full_name, nse_code):
+        """Fill rank slot idx (1-based) and pass the row on to the progress listener"""
+        results[idx - 1] = {"Stock Name": full_name, "NSE": nse_code}
+        self._notify("row", idx, results[idx - 1])
+    
+    def _detail_worker(self, worker_id, link_queue, results, given_up):
+        """Drain (idx, url) jobs from link_queue with one pooled Chrome; jobs not worth re-queuing go in given_up"""
+        driver = None
+        try:
+            driver = self._acquire_driver()
             
-            # Process each stock link
-            for idx, stock_url in enumerate(stock_links[:100], 1):
+            while not self.abort_event.is_set():
                 try:
-                    # Open in new tab
-                    driver.execute_script("window.open(arguments[0], '_blank');", stock_url)
-                    time.sleep(1)
-                    
-                    # Switch to new tab
-                    original_window = driver.current_window_handle
-                    WebDriverWait(driver, 10).until(EC.number_of_windows_to_be(2))
-                    driver.switch_to.window(driver.window_handles[-1])
-                    time.sleep(2)
-                    
-                    # Extract full stock name from stock_info_heading
-                    full_name = "N/A"
-                    try:
-                        full_name = driver.find_element(By.CSS_SELECTOR, "span.stock_info_heading").text.strip()
-                    except:
-                        try:
-                            full_name = driver.find_element(By.TAG_NAME, "h1").text.strip()
-                        except:
-                            pass
-                    
-                    # Extract NSE code from stock_exchange_details
-                    nse_code = "N/A"
-                    try:
-                        stock_exchange_div = driver.find_element(By.CSS_SELECTOR, "span.stock_exchange_details")
-                        nse_text = stock_exchange_div.text
-                        
-                        # Parse NSE code - format: "NSE: SYMBOLCODE | BSE: 123456 | ASM"
-                        lines = nse_text.split("\n")
-                        for line in lines:
-                            if "NSE:" in line:
-                                # Extract just the symbol after "NSE:"
-                                nse_part = line.split("NSE:")[1].strip()
-                                # Take only the first part before any pipe or special character
-                                nse_code = nse_part.split("|")[0].strip()
-                                break
-                    except:
-                        pass
-                    
-                    # Store data
-                    if full_name != "N/A" and nse_code != "N/A":
-                        trendlyne_data.append({
-                            "Stock Name": full_name,
-                            "NSE": nse_code
-                        })
-                        logging.info(f"  [{idx:3}] {full_name:<50} | NSE: {nse_code}")
-                    else:
-                        logging.warning(f"  [{idx:3}] Failed to extract - Name: {full_name}, NSE: {nse_code}")
-                    
-                    # Close tab and switch back to main window
-                    driver.close()
-                    driver.switch_to.window(original_window)
-                    time.sleep(0.5)
+                    idx, stock_url = link_queue.get_nowait()
+                except queue.Empty:
+                    return
+                
+                def load_detail():
+                    full_name, nse_code = self.extract_stock_detail(driver, stock_url)
+                    if full_name == "N/A" or nse_code == "N/A":
+                        raise PageParseError(f"Failed to extract - Name: {full_name}, NSE: {nse_code}")
+                    return full_name, nse_code
+                
+                try:
+                    with self.metrics.time("detail_page_selenium"):
+                        full_name, nse_code = self.fetch_with_retry(stock_url, load_detail, "detail_page_selenium")
                     
+                    self._store_detail(results, idx, full_name, nse_code)
+                    self.metrics.inc("detail_pages_total", engine="selenium", result="ok")
+                    logging.info(f"  [{idx:3}] {full_name:<50} | NSE: {nse_code}")
+                except PageParseError as e:
+                    # Reloading a page that rendered without the fields rarely helps: not re-queued
+                    given_up.add(idx)
+                    self.metrics.inc("detail_pages_total", engine="selenium", result="unparsed")
+                    logging.warning(f"  [{idx:3}] {str(e)}")
+                except CircuitOpenError as e:
+                    # The host is down; the breaker would reject a re-queued job just the same
+                    given_up.add(idx)
+                    self.metrics.inc("detail_pages_total", engine="selenium", result="rejected")
+                    logging.error(f"  [{idx:3}] {str(e)}")
                 except Exception as e:
+                    self.metrics.inc("detail_pages_total", engine="selenium", result="error")
                     logging.error(f"  [{idx:3}] Error: {str(e)}")
-                    try:
-                        if len(driver.window_handles) > 1:
-                            driver.close()
-                            driver.switch_to.window(driver.window_handles[0])
-                    except:
-                        pass
-                    continue
-            
-            logging.info(f"\n✓ Successfully extracted {len(trendlyne_data)} top gainers from Trendlyne")
-            return pd.DataFrame(trendlyne_data)
-            
+        
         except Exception as e:
-            logging.error(f"Error scraping Trendlyne: {str(e)}")
-            return pd.DataFrame(columns=["Stock Name", "NSE"])
+            logging.error(f"Detail worker {worker_id} failed: {str(e)}")
         
         finally:
-            driver.quit()
+            if driver:
+                self.driver_pool.release(driver)
+    
+    def _fetch_details_selenium(self, jobs, results):
+        """
+        Resolve (idx, url) jobs on a bounded pool of browser workers
+        Returns: list of jobs that are still unresolved and worth re-queuing
+        """
+        num_workers = max(1, min(self.detail_workers, len(jobs)))
+        logging.info(f"Processing {len(jobs)} stocks on {num_workers} browser workers...\n")
+        
+        link_queue = queue.Queue()
+        for job in jobs:
+            link_queue.put(job)
+        
+        given_up = set()
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="detail") as executor:
+            for worker_id in range(1, num_workers + 1):
+                executor.submit(self._detail_worker, worker_id, link_queue, results, given_up)
+        
+        return [job for job in jobs if results[job[0] - 1] is None and job[0] not in given_up]
+    
+    def _fetch_details(self, jobs, results):
+        """
+        One pass over (idx, url) jobs: plain HTTP when enabled, then Selenium for pages HTTP could not parse
+        Returns: list of jobs that are still unresolved and worth re-queuing (fetch failures, not
+        unparsable pages, client errors or open-circuit rejections)
+        """
+        failed = []
+        if jobs and self.detail_engine == "http":
+            logging.info(f"Fetching {len(jobs)} stock pages over HTTP...\n")
+            jobs, failed = self._fetch_details_http(jobs, results)
+            if jobs:
+                logging.info(f"HTTP fast path could not parse {len(jobs)} stocks, falling back to Selenium")
+            if failed:
+                logging.info(f"HTTP fast path could not fetch {len(failed)} stocks")
+        
+        if jobs and not self.abort_event.is_set():
+            jobs = self._fetch_details_selenium(jobs, results)
+        
+        return jobs + failed
+    
+    def _requeue_details(self, jobs, results):
+        """
+        Retry failed jobs once more, after any open host breaker has had time to let a probe through
+        Returns: list of jobs that are still unresolved
+        """
+        wait_s = max(self.breaker_for(stock_url).retry_after() for _, stock_url in jobs)
+        if wait_s > 0:
+            logging.info(f"Waiting {wait_s:.1f}s for open circuits before re-queuing")
+            self.abort_event.wait(wait_s)
+        
+        logging.warning(f"Re-queuing {len(jobs)} failed stocks")
+        self.metrics.inc("detail_requeued_total", len(jobs))
+        jobs = self._fetch_details(jobs, results)
+        
+        for idx, stock_url in jobs:
+            logging.error(f"  [{idx:3}] Could not resolve {stock_url}")
+        return jobs
+    
+    def scrape_stock_details(self, stock_links):
+        """
+        Resolve stock detail pages: cached symbols first, then plain HTTP when enabled, then Selenium
+        Returns: list of {"Stock Name", "NSE"} dicts in the original Trendlyne rank order
+        """
+        return [row for row in self.resolve_stock_details(stock_links) if row]
+    
+    def resolve_stock_details(self, stock_links, known=None):
+        """
+        Same as scrape_stock_details but keeps one slot per link
+        known: {url: row} already resolved (incremental mode); used as is, without a lookup or fetch
+        Detail pages fetched here are timestamped in self.verified_at
+        Returns: list aligned with stock_links - {"Stock Name", "NSE"} dicts, None where unresolved
+        """
+        if not stock_links:
+            return []
+        
+        # One slot per link so results merge back in rank order; failures stay None
+        results = [None] * len(stock_links)
+        jobs = list(enumerate(stock_links, 1))
+        
+        if known:
+            for idx, stock_url in jobs:
+                if stock_url in known:
+                    self._store_detail(results, idx, known[stock_url]["Stock Name"], known[stock_url]["NSE"])
+            jobs = [job for job in jobs if job[1] not in known]
+            self.metrics.inc("incremental_details_total", len(stock_links) - len(jobs), kind="reused")
+            self.metrics.inc("incremental_details_total", len(jobs), kind="new")
+            logging.info(f"Incremental: {len(stock_links) - len(jobs)} stocks carried over, {len(jobs)} new")
+        
+        # Only symbols that are new or stale need their detail page visited
+        fresh, stale = {}, {}
+        if self.symbol_cache and jobs:
+            try:
+                fresh, stale = self.symbol_cache.lookup([stock_url for _, stock_url in jobs])
+            except sqlite3.Error as e:
+                logging.warning(f"Symbol cache unavailable: {str(e)}")
+        
+        for idx, stock_url in jobs:
+            if stock_url in fresh:
+                full_name, nse_code = fresh[stock_url]
+                self._store_detail(results, idx, full_name, nse_code)
+        jobs = [job for job in jobs if job[1] not in fresh]
+        self.metrics.inc("symbol_cache_total", len(fresh), result="fresh")
+        self.metrics.inc("symbol_cache_total", len(stale), result="stale")
+        self.metrics.inc("symbol_cache_total", len(jobs) - len(stale), result="miss")
+        logging.info(f"Symbol cache: {len(fresh)} fresh, {len(stale)} stale, "
+                     f"{len(jobs) - len(stale)} new")
+        
+        jobs = self._fetch_details(jobs, results)
+        
+        # Failed stocks get one more pass at the end rather than silently dropping out
+        if jobs and not self.abort_event.is_set():
+            jobs = self._requeue_details(jobs, results)
+        
+        # Remember what was resolved; stale entries that failed to revalidate keep their old values
+        resolved = [(stock_url, results[idx - 1]["Stock Name"], results[idx - 1]["NSE"])
+                    for idx, stock_url in enumerate(stock_links, 1)
+                    if results[idx - 1] and stock_url not in fresh and stock_url not in (known or {})]
+        fetched_at = time.time()
+        self.verified_at.update((stock_url, fetched_at) for stock_url, _, _ in resolved)
+        for idx, stock_url in enumerate(stock_links, 1):
+            if results[idx - 1] is None and stock_url in stale:
+                full_name, nse_code = stale[stock_url]
+                self._store_detail(results, idx, full_name, nse_code)
+                logging.warning(f"  [{idx:3}] Revalidation failed, using cached {nse_code}")
+        self.metrics.inc("detail_dropped_total", sum(row is None for row in results))
+        
+        if self.symbol_cache:
+            try:
+                self.symbol_cache.store(resolved)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not update symbol cache: {str(e)}")
+        
+        return results
+    
+    def previous_ranking(self, screen=DEFAULT_SCREEN):
+        """The screen's rank list from its last stored run: [(url, row or None, verified_at)] ([] if none)"""
+        if not self.result_store:
+            return []
+        try:
+            stored = self.result_store.ranking(screen)
+        except sqlite3.Error as e:
+            logging.warning(f"Previous ranking unavailable: {str(e)}")
+            return []
+        return stored[1] if stored else []
+    
+    def _known_details(self, rankings):
+        """
+        Rows to carry over from previous rank lists in incremental mode (None otherwise)
+        Only rows whose detail page was fetched within the symbol cache TTL qualify; the rest
+        (expired, or served from the symbol cache, which keeps its own TTL) are resolved again
+        """
+        if not self.incremental:
+            return None
+        ttl = self.symbol_cache.ttl if self.symbol_cache else SYMBOL_CACHE_TTL
+        now = time.time()
+        known, expired = {}, 0
+        for ranking in rankings:
+            for url, row, verified_at in ranking:
+                if row and verified_at and now - verified_at < ttl:
+                    known[url] = row
+                elif row:
+                    expired += 1
+        if expired:
+            logging.info(f"Incremental: {expired} carried-over rows are past the TTL or cache-served, re-resolving")
+        return known
+    
+    def _record_ranking(self, screen, links, details, previous, known=None):
+        """Keep the run's rank list for save_results and compare it with the previous one"""
+        # Carried-over rows keep the time their page was fetched, so they expire on schedule
+        previous_verified = {url: verified_at for url, _, verified_at in previous}
+        self.rankings[screen] = [
+            (url, row, previous_verified.get(url) if url in (known or {}) else self.verified_at.get(url))
+            for url, row in zip(links, details)
+        ]
+        if not previous:
+            return
+        
+        delta = self.rank_delta(previous, self.rankings[screen])
+        self.rank_deltas[screen] = delta
+        logging.info(f"Rank delta ({screen}): {len(delta['entries'])} entries, {len(delta['exits'])} exits, "
+                     f"{len(delta['moves'])} moves")
+        for entry in delta["entries"]:
+            logging.info(f"  + [{entry['rank']:3}] {entry['nse']}")
+        for entry in delta["exits"]:
+            logging.info(f"  - [{entry['rank']:3}] {entry['nse']}")
+    
+    @staticmethod
+    def rank_delta(previous, current):
+        """
+        Entries, exits and moves between two rank lists of (url, row or None, ...) entries
+        Returns: {"entries": [{url, nse, rank}], "exits": [{url, nse, rank}], "moves": [{url, nse, from, to}]}
+        """
+        def nse(row):
+            return row["NSE"] if row else None
+        
+        before = {url: (rank, row) for rank, (url, row, *_) in enumerate(previous, 1)}
+        after = {url: (rank, row) for rank, (url, row, *_) in enumerate(current, 1)}
+        return {
+            "entries": [{"url": url, "nse": nse(row), "rank": rank}
+                        for url, (rank, row) in after.items() if url not in before],
+            "exits": [{"url": url, "nse": nse(row), "rank": rank}
+                      for url, (rank, row) in before.items() if url not in after],
+            "moves": [{"url": url, "nse": nse(row), "from": before[url][0], "to": rank}
+                      for url, (rank, row) in after.items() if url in before and before[url][0] != rank],
+        }
 
     # ============================================================================
     # MAP AND FILTER - Add Leverage Column
     # ============================================================================
     
-    def map_leverage(self, trendlyne_df, zerodha_5x_set):
+    def map_leverage(self, trendlyne_df, leverage_data, min_leverage=None):
         """
-        Map Trendlyne NSE codes to Zerodha 5x leverage
+        Map Trendlyne NSE codes to Zerodha leverage with one vectorized lookup
+        leverage_data: LeverageTable from leverage_table; a plain dict of NSE code -> leverage like "5x"
+                       is converted on every call, and a plain set of codes is read as all 5x
+        min_leverage: stocks below this multiplier get NA (defaults to self.min_leverage)
         Returns: DataFrame with Leverage column added
         """
+        if min_leverage is None:
+            min_leverage = self.min_leverage
+        
         logging.info("\n" + "="*80)
-        logging.info("[Task 3] Mapping Zerodha 5x Leverage to Trendlyne Stocks...")
+        logging.info(f"[Task 3] Mapping Zerodha >={min_leverage}x Leverage to Trendlyne Stocks...")
         logging.info("="*80)
         
-        result_df = trendlyne_df.copy()
+        if isinstance(leverage_data, (set, frozenset)):
+            leverage_data = dict.fromkeys(leverage_data, "5x")
+        if not isinstance(leverage_data, LeverageTable):
+            leverage_data = LeverageTable(leverage_data)
         
-        # Add Leverage column - 5x if in Zerodha's 5x set, else NA
-        result_df['Leverage'] = result_df['NSE'].apply(
-            lambda x: '5x' if x.upper() in zerodha_5x_set else 'NA'
-        )
+        result_df = trendlyne_df[['Stock Name', 'NSE']].copy()
+        
+        # Join against the prebuilt leverage index: one hash lookup for the whole column
+        positions = leverage_data.index.get_indexer(result_df['NSE'].str.upper())
         
-        # Reorder columns
-        result_df = result_df[['Stock Name', 'NSE', 'Leverage']]
+        found = positions >= 0
+        qualified = np.zeros(len(result_df), dtype=bool)
+        qualified[found] = leverage_data.multipliers[positions[found]] >= min_leverage
+        
+        # Add Leverage column - Zerodha's label if at or above the threshold, else NA
+        leverage = np.full(len(result_df), 'NA', dtype=object)
+        leverage[qualified] = leverage_data.labels[positions[qualified]]
+        result_df['Leverage'] = leverage
         
         # Count results
-        count_5x = len(result_df[result_df['Leverage'] == '5x'])
-        count_na = len(result_df[result_df['Leverage'] == 'NA'])
+        count_leveraged = int(qualified.sum())
         
-        logging.info(f"✓ Mapping complete!")
-        logging.info(f"  • Stocks with 5x leverage: {count_5x}")
-        logging.info(f"  • Stocks with NA leverage: {count_na}")
+        logging.info("✓ Mapping complete!")
+        logging.info(f"  • Stocks with >={min_leverage}x leverage: {count_leveraged}")
+        logging.info(f"  • Stocks with NA leverage: {len(result_df) - count_leveraged}")
         
         return result_df
 
@@ -307,33 +1986,93 @@ class CombinedStockScraper:
     # SAVE RESULTS
     # ============================================================================
     
-    def save_results(self, result_df):
-        """Save results to Excel and CSV files"""
+    def leverage_label(self, nse_code, leverage_data, min_leverage=None):
+        """
+        Leverage for a single NSE code by the same rule as map_leverage
+        Returns: Zerodha's label (e.g. "5x") if at or above min_leverage, else "NA"
+        """
+        if min_leverage is None:
+            min_leverage = self.min_leverage
+        
+        label = leverage_data.get(str(nse_code).upper())
+        try:
+            multiplier = float(str(label).rstrip("x"))
+        except ValueError:
+            return "NA"
+        return label if multiplier >= min_leverage else "NA"
+    
+    def order_results(self, result_df):
+        """
+        Put leveraged stocks first and NA stocks after, keeping Trendlyne order within each group
+        Returns: DataFrame with Stock Name, NSE, Leverage columns
+        """
+        # One stable argsort on "is NA": leveraged first, then NA, Trendlyne order kept within each group
+        order = np.argsort(result_df['Leverage'].eq('NA').to_numpy(), kind='stable')
+        return result_df[['Stock Name', 'NSE', 'Leverage']].take(order).reset_index(drop=True)
+    
+    def save_results(self, result_df, screen=DEFAULT_SCREEN):
+        """
+        Order the results and append them to the snapshot store (run id in self.run_ids[screen])
+        Returns: ordered DataFrame
+        """
         logging.info("\n" + "="*80)
         logging.info("[Task 4] Saving Results...")
         logging.info("="*80)
         
+        result_df_clean = self.order_results(result_df)
+        if not self.result_store:
+            return result_df_clean
+        
         try:
-            # Separate into 5x and NA, but keep original order within each group
-            result_df_5x = result_df[result_df['Leverage'] == '5x'].reset_index(drop=True)
-            result_df_na = result_df[result_df['Leverage'] == 'NA'].reset_index(drop=True)
-            
-            # Concatenate: 5x first (in Trendlyne order), then NA (in Trendlyne order)
-            result_df_sorted = pd.concat([result_df_5x, result_df_na], ignore_index=True)
-            result_df_clean = result_df_sorted[['Stock Name', 'NSE', 'Leverage']].copy()
-            
-            # Save to Excel
-            result_df_clean.to_excel(self.output_excel, index=False, engine='openpyxl')
-            logging.info(f"✓ Saved to Excel: {self.output_excel}")
-            
-            # Save to CSV
-            result_df_clean.to_csv(self.output_csv, index=False, encoding='utf-8-sig')
-            logging.info(f"✓ Saved to CSV: {self.output_csv}")
+            self.run_ids[screen] = self.result_store.save(result_df_clean, self.timestamp, screen)
+            logging.info(f"✓ Saved snapshot #{self.run_ids[screen]} ({screen}) to {self.result_store.path}")
+            # The next run's incremental mode and rank delta start from this list
+            if self.rankings.get(screen):
+                self.result_store.save_ranking(self.rankings[screen], self.timestamp, screen)
+        except sqlite3.Error as e:
+            logging.error(f"Error saving snapshot: {str(e)}")
+        
+        return result_df_clean
+    
+    def export_results(self, result_df, output_excel=None, output_csv=None):
+        """
+        Write results to Excel and/or CSV; pass False to skip a format (defaults: self.output_excel / self.output_csv)
+        Returns: list of written paths
+        """
+        if output_excel is None:
+            output_excel = self.output_excel
+        if output_csv is None:
+            output_csv = self.output_csv
+        
+        written = []
+        try:
+            if output_excel:
+                result_df.to_excel(output_excel, index=False, engine='openpyxl')
+                logging.info(f"✓ Saved to Excel: {output_excel}")
+                written.append(output_excel)
             
-            return result_df_clean
+            if output_csv:
+                result_df.to_csv(output_csv, index=False, encoding='utf-8-sig')
+                logging.info(f"✓ Saved to CSV: {output_csv}")
+                written.append(output_csv)
         except Exception as e:
             logging.error(f"Error saving files: {str(e)}")
-            return result_df
+        
+        return written
+    
+    def export_latest(self, screen=DEFAULT_SCREEN):
+        """
+        Export the latest stored snapshot of a screen to Excel and CSV without scraping
+        Returns: list of written paths ([] if nothing is stored)
+        """
+        latest = self.result_store.latest(screen) if self.result_store else None
+        if latest is None:
+            logging.error(f"No stored snapshot for screen '{screen}'")
+            return []
+        
+        run_id, timestamp, result_df = latest
+        logging.info(f"Exporting snapshot #{run_id} ({screen}, {timestamp})")
+        return self.export_results(result_df, *self.output_paths(screen, timestamp))
 
     # ============================================================================
     # DISPLAY RESULTS
@@ -351,36 +2090,226 @@ class CombinedStockScraper:
     # MAIN EXECUTION
     # ============================================================================
     
-    def run(self):
-        """Main execution"""
-        print("\n" + "="*100)
-        print("COMBINED STOCK SCRAPER - TRENDLYNE TOP GAINERS + ZERODHA 5X LEVERAGE")
-        print("="*100)
+    def _timed_stage(self, stage, func, *args, **kwargs):
+        """Run one stage and record its wall-clock duration in self.stage_timings"""
+        stage_start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stage_timings[stage] = time.time() - stage_start
+            self.metrics.observe(stage, self.stage_timings[stage])
+            logging.info(f"⏱ Stage '{stage}' took {self.stage_timings[stage]:.2f}s")
+    
+    def scrape_sources_concurrently(self):
+        """
+        Scrape Zerodha and Trendlyne in parallel, each with its own Chrome
+        If either source fails, the other one is signalled to stop
+        Returns: (all_leverage_data, trendlyne_df)
+        """
+        logging.info("Scraping Zerodha and Trendlyne concurrently...")
         
-        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="source") as executor:
+            zerodha_future = executor.submit(self._timed_stage, "zerodha", self.scrape_zerodha_leverage)
+            trendlyne_future = executor.submit(self._timed_stage, "trendlyne", self.scrape_trendlyne_gainers)
+            
+            pending = {zerodha_future, trendlyne_future}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                
+                # Abort the other source as soon as one comes back empty
+                if zerodha_future in done:
+                    if zerodha_future.result():
+                        self._notify("leverage", zerodha_future.result())
+                    else:
+                        self.abort_event.set()
+                if trendlyne_future in done and trendlyne_future.result().empty:
+                    self.abort_event.set()
         
-        # Step 1: Scrape Zerodha (faster)
-        zerodha_5x_set, all_leverage_data = self.scrape_zerodha_leverage()
+        return zerodha_future.result(), trendlyne_future.result()
+    
+    def scrape(self, save_files=True):
+        """
+        Run the whole pipeline in-process
+        save_files: also append the result to the snapshot store (run id in run_ids) and write
+                    the JSON run report (RUN_REPORT_PATH); Excel/CSV come from export_results()
+        Returns: result DataFrame (5x first, then NA, each in Trendlyne order), or None if a source failed
+        """
+        start_time = self._start_run()
+        result_df_sorted = None
         
-        if not zerodha_5x_set:
-            logging.error("Failed to scrape Zerodha. Aborting.")
-            return False
+        try:
+            result_df_sorted = self._scrape_pipeline(save_files, start_time)
+            return result_df_sorted
+        finally:
+            self._finish_run(
+                start_time, save_files,
+                mode="concurrent" if self.concurrent else "sequential",
+                incremental=self.incremental,
+                success=result_df_sorted is not None,
+                rows=0 if result_df_sorted is None else len(result_df_sorted),
+            )
+    
+    def scrape_stream(self, save_files=True):
+        """
+        Run scrape() in a background thread and yield rows as soon as their final position is settled
+        A leveraged stock is yielded once every higher-ranked stock is resolved, so the first N
+        yielded rows are the top N of the finished result; NA stocks follow when the run ends
+        Yields: {"Stock Name", "NSE", "Leverage"} dicts in result order
+        The finished DataFrame (or None on failure) is left in self.last_result
+        """
+        events = queue.Queue()
         
-        # Step 2: Scrape Trendlyne Top 100 Gainers
-        trendlyne_df = self.scrape_trendlyne_gainers()
+        def run():
+            result_df = None
+            try:
+                result_df = self.scrape(save_files=save_files)
+            except Exception as e:
+                logging.error(f"Streaming scrape failed: {str(e)}")
+            finally:
+                self.progress_listener = None
+                events.put(("done", result_df))
         
-        if trendlyne_df.empty:
-            logging.error("Failed to scrape Trendlyne. Aborting.")
-            return False
+        self.last_result = None
+        self.progress_listener = lambda *event: events.put(event)
+        threading.Thread(target=run, name="scrape-stream", daemon=True).start()
         
-        # Step 3: Map Leverage
-        result_df = self.map_leverage(trendlyne_df, zerodha_5x_set)
+        leverage_data, slots = None, None
+        next_rank, emitted = 0, 0
+        while True:
+            event, *payload = events.get()
+            
+            if event == "done":
+                self.last_result = payload[0]
+                if self.last_result is not None:
+                    # Whatever is left: leveraged stocks behind an unresolved rank, then every NA stock
+                    yield from self.last_result.to_dict('records')[emitted:]
+                return
+            
+            if event == "leverage":
+                leverage_data = payload[0]
+            elif event == "links":
+                slots = [None] * payload[0]
+            elif event == "row" and slots is not None:
+                rank, row = payload
+                slots[rank - 1] = row
+            
+            if leverage_data is None or slots is None:
+                continue
+            
+            # Walk the contiguous resolved prefix; only leveraged stocks can be placed before the run ends
+            while next_rank < len(slots) and slots[next_rank] is not None:
+                row = slots[next_rank]
+                next_rank += 1
+                leverage = self.leverage_label(row["NSE"], leverage_data)
+                if leverage != "NA":
+                    emitted += 1
+                    yield dict(row, Leverage=leverage)
+    
+    def scrape_screens(self, screens=None, save_files=True):
+        """
+        Multi-screen run: load every screen's list page in parallel, resolve each unique stock
+        once, and map all screens against one Zerodha leverage table
+        screens: dict of name -> Trendlyne URL (defaults to TRENDLYNE_SCREENS)
+        save_files: store one snapshot per screen (see run_ids) and write the run report
+        Returns: dict of name -> result DataFrame for the screens that produced rows,
+                 or None if Zerodha failed
+        """
+        screens = dict(screens or TRENDLYNE_SCREENS)
+        start_time = self._start_run()
+        results = None
+        
+        try:
+            results = self._scrape_screens_pipeline(screens, save_files, start_time)
+            return results
+        finally:
+            self._finish_run(
+                start_time, save_files,
+                mode="screens",
+                incremental=self.incremental,
+                success=bool(results),
+                rows=sum(len(df) for df in (results or {}).values()),
+                screens={name: len(results[name]) if results and name in results else 0 for name in screens},
+            )
+    
+    def _start_run(self):
+        """Reset per-run state; returns the run start time"""
+        self.abort_event.clear()
+        self.stage_timings = {}
+        self.metrics = ScrapeMetrics()
+        self.run_ids = {}
+        self.rankings = {}
+        self.rank_deltas = {}
+        self.verified_at = {}
+        self.leverage_fallback = None
+        self.set_output_paths()
+        return time.time()
+    
+    def _finish_run(self, start_time, save_files, **report):
+        """Record the run in METRICS and build (and optionally write) last_report"""
+        execution_time = time.time() - start_time
+        self.metrics.observe("total", execution_time)
+        self.metrics.inc("runs_total", result="ok" if report["success"] else "failed")
+        METRICS.merge(self.metrics)
+        
+        self.last_report = dict(
+            timestamp=self.timestamp,
+            snapshots=dict(self.run_ids),
+            rank_delta=dict(self.rank_deltas),
+            leverage_fallback=self.leverage_fallback,
+            driver_pool=self.driver_pool.stats(),
+            **report,
+            total_s=round(execution_time, 3),
+            **self.metrics.report()
+        )
+        if save_files:
+            self.write_run_report()
+    
+    def write_run_report(self, path=RUN_REPORT_PATH):
+        """Write the last run's metrics as JSON"""
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.last_report, f, indent=2)
+            logging.info(f"✓ Saved run report: {path}")
+        except OSError as e:
+            logging.error(f"Error saving run report: {str(e)}")
+    
+    def _scrape_pipeline(self, save_files, start_time):
+        """Steps 1-4 of scrape(); returns the ordered result DataFrame or None"""
+        if self.concurrent:
+            # Steps 1 + 2 in parallel: latency is max(Zerodha, Trendlyne)
+            all_leverage_data, trendlyne_df = self.scrape_sources_concurrently()
+            
+            if not all_leverage_data:
+                logging.error("Failed to scrape Zerodha. Aborting.")
+                return None
+            
+            if trendlyne_df.empty:
+                logging.error("Failed to scrape Trendlyne. Aborting.")
+                return None
+        else:
+            # Step 1: Scrape Zerodha (faster)
+            all_leverage_data = self._timed_stage("zerodha", self.scrape_zerodha_leverage)
+            
+            if not all_leverage_data:
+                logging.error("Failed to scrape Zerodha. Aborting.")
+                return None
+            self._notify("leverage", all_leverage_data)
+            
+            # Step 2: Scrape Trendlyne Top 100 Gainers
+            trendlyne_df = self._timed_stage("trendlyne", self.scrape_trendlyne_gainers)
+            
+            if trendlyne_df.empty:
+                logging.error("Failed to scrape Trendlyne. Aborting.")
+                return None
         
-        # Step 4: Save Results
-        result_df_sorted = self.save_results(result_df)
+        # Step 3: Map Leverage
+        result_df = self._timed_stage("map_leverage", self.map_leverage, trendlyne_df, all_leverage_data)
         
-        # Step 5: Display Results
-        self.display_results(result_df_sorted)
+        # Step 4: Save Results (or just order them when no files are wanted)
+        if save_files:
+            result_df_sorted = self._timed_stage("save_results", self.save_results, result_df)
+        else:
+            result_df_sorted = self.order_results(result_df)
         
         # Summary
         execution_time = time.time() - start_time
@@ -389,10 +2318,150 @@ class CombinedStockScraper:
         logging.info("="*80)
         logging.info(f"Total Trendlyne Top Gainers: {len(trendlyne_df)}")
         logging.info(f"Total Zerodha Stocks Checked: {len(all_leverage_data)}")
-        logging.info(f"Stocks with 5x Leverage: {len(result_df[result_df['Leverage'] == '5x'])}")
-        logging.info(f"Stocks with NA Leverage: {len(result_df[result_df['Leverage'] == 'NA'])}")
+        count_na = int(result_df['Leverage'].eq('NA').sum())
+        logging.info(f"Stocks with >={self.min_leverage}x Leverage: {len(result_df) - count_na}")
+        logging.info(f"Stocks with NA Leverage: {count_na}")
+        logging.info(f"Mode: {'concurrent' if self.concurrent else 'sequential'}"
+                     f"{', incremental' if self.incremental else ''}")
+        for stage, seconds in self.stage_timings.items():
+            logging.info(f"  • {stage:<14} {seconds:8.2f}s")
+        for stage, summary in self.metrics.report()["stages"].items():
+            if stage.startswith("detail_page"):
+                logging.info(f"  • {stage:<22} n={summary['count']:<4} p50 {summary['p50_s']:.2f}s | "
+                             f"p95 {summary['p95_s']:.2f}s")
+        logging.info(f"Total execution time: {execution_time:.2f}s")
+        logging.info("="*80)
+        
+        return result_df_sorted
+    
+    def collect_screen_links(self, screens):
+        """
+        Load every screen's list page in parallel, one pooled Chrome each
+        Returns: dict of name -> list of stock URLs ([] for screens that failed)
+        """
+        logging.info("\n" + "="*80)
+        logging.info(f"[Task 2] Loading {len(screens)} Trendlyne screens...")
+        logging.info("="*80)
+        
+        num_workers = max(1, min(SCREEN_WORKERS, len(screens)))
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="screen") as executor:
+            futures = {name: executor.submit(self.collect_trendlyne_links, url) for name, url in screens.items()}
+        
+        links_by_screen = {}
+        for name, future in futures.items():
+            try:
+                links_by_screen[name] = future.result()
+            except Exception as e:
+                logging.error(f"Screen '{name}' failed: {str(e)}")
+                links_by_screen[name] = []
+            logging.info(f"  • {name:<24} {len(links_by_screen[name])} stocks")
+        return links_by_screen
+    
+    def _scrape_screens_pipeline(self, screens, save_files, start_time):
+        """Steps 1-4 of scrape_screens(); returns dict of name -> ordered result DataFrame, or None"""
+        # Steps 1 + 2 in parallel: one Zerodha scrape shared by every screen
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="source") as executor:
+            zerodha_future = executor.submit(self._timed_stage, "zerodha", self.scrape_zerodha_leverage)
+            screens_future = executor.submit(self._timed_stage, "trendlyne_lists", self.collect_screen_links, screens)
+            
+            all_leverage_data = zerodha_future.result()
+            if not all_leverage_data:
+                # No point resolving detail pages that can't be mapped
+                self.abort_event.set()
+            links_by_screen = screens_future.result()
+        
+        if not all_leverage_data:
+            logging.error("Failed to scrape Zerodha. Aborting.")
+            return None
+        
+        # Each stock's detail page is resolved once, however many screens list it
+        listed = sum(len(links) for links in links_by_screen.values())
+        unique_links = list(dict.fromkeys(link for links in links_by_screen.values() for link in links))
+        self.metrics.inc("screen_links_total", listed, kind="listed")
+        self.metrics.inc("screen_links_total", len(unique_links), kind="unique")
+        logging.info(f"{listed} stocks across {len(screens)} screens, {len(unique_links)} unique")
+        
+        previous = {name: self.previous_ranking(name) for name in links_by_screen}
+        known = self._known_details(previous.values())
+        details = self._timed_stage("trendlyne", self.resolve_stock_details, unique_links, known)
+        detail_by_url = dict(zip(unique_links, details))
+        for name, links in links_by_screen.items():
+            if links:
+                self._record_ranking(name, links, [detail_by_url[link] for link in links], previous[name], known)
+        
+        # Steps 3 + 4 per screen against the same leverage table
+        results = self._timed_stage("map_leverage", self._map_screens, links_by_screen, detail_by_url,
+                                    all_leverage_data, save_files)
+        
+        # Summary
+        execution_time = time.time() - start_time
+        logging.info("\n" + "="*80)
+        logging.info("EXECUTION SUMMARY")
+        logging.info("="*80)
+        logging.info(f"Screens: {len(results)}/{len(screens)} | detail pages resolved: {len(unique_links)} "
+                     f"(instead of {listed})")
+        logging.info(f"Total Zerodha Stocks Checked: {len(all_leverage_data)}")
+        for name, result_df in results.items():
+            count_na = int(result_df['Leverage'].eq('NA').sum())
+            logging.info(f"  • {name:<24} {len(result_df):4} stocks | >={self.min_leverage}x: "
+                         f"{len(result_df) - count_na:4} | NA: {count_na:4}")
+        for stage, seconds in self.stage_timings.items():
+            logging.info(f"  • {stage:<14} {seconds:8.2f}s")
+        logging.info(f"Total execution time: {execution_time:.2f}s")
         logging.info("="*80)
         
+        return results
+    
+    def _map_screens(self, links_by_screen, detail_by_url, leverage_data, save_files):
+        """Build, map and order (and optionally save) each screen from the shared detail lookup"""
+        results = {}
+        for name, links in links_by_screen.items():
+            trendlyne_df = pd.DataFrame([detail_by_url[link] for link in links if detail_by_url[link]])
+            if trendlyne_df.empty:
+                logging.error(f"Screen '{name}' produced no stocks, skipping")
+                continue
+            
+            result_df = self.map_leverage(trendlyne_df, leverage_data)
+            if save_files:
+                results[name] = self.save_results(result_df, screen=name)
+            else:
+                results[name] = self.order_results(result_df)
+        return results
+    
+    def run(self, export=False):
+        """Main execution; export also writes the Excel and CSV files"""
+        print("\n" + "="*100)
+        print("COMBINED STOCK SCRAPER - TRENDLYNE TOP GAINERS + ZERODHA 5X LEVERAGE")
+        print("="*100)
+        
+        result_df_sorted = self.scrape(save_files=True)
+        if result_df_sorted is None:
+            return False
+        
+        if export:
+            self.export_results(result_df_sorted)
+        
+        # Step 5: Display Results
+        self.display_results(result_df_sorted)
+        
+        return True
+    
+    def run_screens(self, screens=None, export=False):
+        """Multi-screen execution: one snapshot and one results table per screen"""
+        print("\n" + "="*100)
+        print("COMBINED STOCK SCRAPER - TRENDLYNE MULTI-SCREEN + ZERODHA 5X LEVERAGE")
+        print("="*100)
+        
+        results = self.scrape_screens(screens, save_files=True)
+        if not results:
+            return False
+        
+        for name, result_df in results.items():
+            if export:
+                self.export_results(result_df, *self.output_paths(name))
+            print(f"\n[{name}]")
+            self.display_results(result_df)
+        
         return True
 
 
@@ -401,8 +2470,22 @@ class CombinedStockScraper:
 # ============================================================================
 
 if __name__ == "__main__":
-    scraper = CombinedStockScraper()
-    success = scraper.run()
+    # --incremental only fetches detail pages for stocks the last stored run did not list
+    scraper = CombinedStockScraper(concurrent="--concurrent" in sys.argv, incremental="--incremental" in sys.argv)
+    export = "--export" in sys.argv
+    
+    # --export-latest[=screen] writes Excel/CSV from the stored snapshot without scraping
+    export_latest_arg = next((arg for arg in sys.argv if arg.split("=")[0] == "--export-latest"), None)
+    if export_latest_arg:
+        written = scraper.export_latest(export_latest_arg.partition("=")[2] or DEFAULT_SCREEN)
+        sys.exit(0 if written else 1)
+    
+    # --screens runs every TRENDLYNE_SCREENS entry; --screens=1-week-nifty-500,<url>,... picks some
+    screens_arg = next((arg for arg in sys.argv if arg.split("=")[0] == "--screens"), None)
+    if screens_arg:
+        success = scraper.run_screens(resolve_screens(screens_arg.partition("=")[2]), export=export)
+    else:
+        success = scraper.run(export=export)
     
     if success:
         print("\n✅ Scraping completed successfully!")